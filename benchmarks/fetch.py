@@ -0,0 +1,189 @@
+# coding=utf-8
+"""
+Benchmarks the Snakes cog's Wikipedia fetch path and embed building against the local api.php stand-in.
+
+Each operation is one `Snakes.get_snek` call followed by rendering its embed, the same work `snakes.get()` does
+before sending. Operations are run by a number of concurrent workers, and the results - latency percentiles,
+throughput and how many requests reached the stand-in - are printed and can be saved as JSON to compare runs:
+
+    python -m benchmarks.fetch --concurrency 20 --requests 2000 --latency 0.05 --output before.json
+    python -m benchmarks.fetch --concurrency 20 --requests 2000 --latency 0.05 --compare before.json
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import math
+import random
+import time
+from typing import Any, Dict, List
+
+from benchmarks.wiki_server import FakeWiki, WikiServer, load_titles
+from bot.cards import SNAKE_EMOJI_URL, card_embed, make_card
+from bot.cogs.snakes import Snakes
+from bot.http import create_session, pool_stats
+
+log = logging.getLogger(__name__)
+
+
+class BenchmarkBot:
+    """
+    Just enough of a bot for the Snakes cog to run outside of Discord.
+
+    It never becomes ready, so the cog's background tasks never start and don't skew the results.
+    """
+
+    def __init__(self, session):
+        self.loop = asyncio.get_event_loop()
+        self.http_session = session
+        self._ready = asyncio.Event()
+
+    async def wait_until_ready(self):
+        await self._ready.wait()
+
+
+def percentile(values: List[float], percent: float) -> float:
+    """
+    The nearest-rank percentile of some already sorted values.
+    """
+
+    if not values:
+        return 0.0
+
+    rank = max(1, math.ceil(percent / 100 * len(values)))
+    return values[rank - 1]
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    titles = sorted(load_titles())
+    server = WikiServer(
+        FakeWiki(titles), latency=args.latency, jitter=args.jitter,
+        error_rate=args.error_rate, rate_limit=args.rate_limit
+    )
+
+    if args.replay:
+        with open(args.replay, encoding="utf-8") as f:
+            server.recordings = json.load(f)
+
+    url = await server.start()
+    session = create_session()
+    cog = Snakes(BenchmarkBot(session), store_path=":memory:", api_url=url)
+
+    rng = random.Random(args.seed)
+    names = rng.sample(titles, min(args.names, len(titles))) if args.names else titles
+    queue = asyncio.Queue()
+
+    for _ in range(args.requests):
+        queue.put_nowait(rng.choice(names))
+
+    latencies = []
+    errors = 0
+
+    async def worker():
+        nonlocal errors
+
+        while not queue.empty():
+            name = queue.get_nowait()
+            start = time.perf_counter()
+
+            try:
+                data = await cog.get_snek(name)
+
+                if data.get("error"):
+                    errors += 1
+                elif args.embed:
+                    image = next(iter(data["image_list"]), SNAKE_EMOJI_URL)
+                    card_embed(make_card(data, thumbnail=image)).to_dict()
+            except Exception:
+                log.debug("Operation for %r failed", name, exc_info=True)
+                errors += 1
+
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    results = {
+        "timestamp": time.time(),
+        "config": {
+            name: getattr(args, name)
+            for name in ("requests", "concurrency", "names", "latency", "jitter", "error_rate", "rate_limit", "embed")
+        },
+        "operations": len(latencies),
+        "errors": errors,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(len(latencies) / elapsed, 1) if elapsed else 0,
+        "latency_ms": {
+            "p50": round(percentile(latencies, 50) * 1000, 2),
+            "p95": round(percentile(latencies, 95) * 1000, 2),
+            "p99": round(percentile(latencies, 99) * 1000, 2),
+            "max": round(latencies[-1] * 1000, 2) if latencies else 0,
+        },
+        "upstream": server.stats(),
+        "client": cog.wiki.stats()["Wikipedia"],
+        "pool": pool_stats(session),
+    }
+
+    # Unload the cog the same way discord.py does
+    getattr(cog, f"_{cog.__class__.__name__}__unload")()
+    session.close()
+    await server.stop()
+
+    return results
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any]):
+    """
+    Print how a run did against an earlier one.
+    """
+
+    print(f"{'':>16} {'baseline':>12} {'this run':>12} {'change':>8}")
+
+    rows = [
+        (f"latency {key}", baseline["latency_ms"][key], results["latency_ms"][key])
+        for key in ("p50", "p95", "p99")
+    ]
+    rows.append(("throughput", baseline["throughput_rps"], results["throughput_rps"]))
+    rows.append(("upstream reqs", baseline["upstream"]["requests"], results["upstream"]["requests"]))
+
+    for name, old, new in rows:
+        change = f"{(new - old) / old:+.0%}" if old else "n/a"
+        print(f"{name:>16} {old:>12} {new:>12} {change:>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the Snakes cog's Wikipedia fetch path.")
+    parser.add_argument("--requests", type=int, default=1000, help="operations to run in total")
+    parser.add_argument("--concurrency", type=int, default=10, help="operations to run at the same time")
+    parser.add_argument("--names", type=int, default=0, help="only look up this many distinct snakes (0 for all)")
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds the stand-in adds to every response")
+    parser.add_argument("--jitter", type=float, default=0.02, help="up to this many extra seconds, at random")
+    parser.add_argument("--error-rate", type=float, default=0, help="fraction of requests answered with a 503")
+    parser.add_argument("--rate-limit", type=int, default=None, help="requests per second before answering 429")
+    parser.add_argument("--replay", metavar="FILE", help="serve responses recorded with the stand-in's --record")
+    parser.add_argument("--no-embed", dest="embed", action="store_false", help="don't build the embeds")
+    parser.add_argument("--seed", type=int, default=0, help="seed for picking the snakes to look up")
+    parser.add_argument("--output", metavar="FILE", help="save the results as JSON")
+    parser.add_argument("--compare", metavar="FILE", help="compare against results saved with --output")
+    args = parser.parse_args()
+
+    # The bot logs everything down to TRACE, which would drown the benchmark
+    logging.getLogger().setLevel(logging.WARNING)
+
+    results = asyncio.get_event_loop().run_until_complete(run(args))
+    print(json.dumps(results, indent=4))
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=4)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            compare(results, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
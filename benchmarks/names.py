@@ -0,0 +1,135 @@
+# coding=utf-8
+"""
+Benchmarks fuzzy snake name resolution: the trigram index the Snake converter uses against scoring every name.
+
+The catalog in snakes.json is grown with made-up names to see how both approaches scale, and the queries are
+real names with typos, cut short, or just a word of them - like people type them. Besides the time per query,
+the benchmark checks how many of the full scan's matches the index finds too:
+
+    python -m benchmarks.names --queries 500 --scales 1 4 16
+"""
+
+import argparse
+import random
+import statistics
+import time
+from functools import partial
+from typing import Callable, Iterable, List
+
+from fuzzywuzzy import fuzz
+
+from bot.catalog import catalog
+from bot.index import TrigramIndex, normalize_name
+from bot.matching import rank_names
+
+THRESHOLD = 80
+
+
+def linear_scan(names: Iterable[str], name: str, threshold: int = THRESHOLD) -> List[str]:
+    """
+    How the Snake converter used to resolve a name: score it against every name there is.
+    """
+
+    potential = []
+
+    for item in names:
+        original, item = item, item.lower()
+
+        if name == item:
+            return [original]
+
+        a, b = fuzz.ratio(name, item), fuzz.partial_ratio(name, item)
+        if a >= threshold or b >= threshold:
+            potential.append(original)
+
+    return potential
+
+
+def indexed(index: TrigramIndex, name: str, threshold: int = THRESHOLD) -> List[str]:
+    """
+    How the Snake converter resolves a name now: score it against the index's candidates only.
+    """
+
+    return [match for match, _ in rank_names(name, threshold=threshold, index=index)]
+
+
+def grow(names: List[str], scale: int, rng: random.Random) -> List[str]:
+    """
+    Make the catalog `scale` times bigger with names made of the words of real ones, like "Banded rat python".
+    """
+
+    words = [name.split() for name in names]
+    grown = set(names)
+
+    while len(grown) < len(names) * scale:
+        first, last = rng.choice(words), rng.choice(words)
+        grown.add(" ".join(first[:rng.randint(1, len(first))] + last[-rng.randint(1, len(last)):]))
+
+    return sorted(grown)
+
+
+def make_query(name: str, rng: random.Random) -> str:
+    kind = rng.randrange(4)
+
+    if kind == 0 and len(name) > 4:
+        # A typo
+        position = rng.randrange(len(name))
+        return name[:position] + rng.choice("aeiourst") + name[position + 1:]
+    if kind == 1 and len(name) > 6:
+        # Cut short
+        return name[:rng.randint(4, len(name) - 1)]
+    if kind == 2:
+        # Just one of its words
+        return rng.choice(name.split())
+    return name
+
+
+def timed(function: Callable, queries: List[str]):
+    timings = []
+    results = []
+
+    for query in queries:
+        start = time.perf_counter()
+        results.append(function(query))
+        timings.append(time.perf_counter() - start)
+
+    return timings, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark fuzzy snake name resolution.")
+    parser.add_argument("--queries", type=int, default=300, help="queries to run against every catalog size")
+    parser.add_argument("--scales", type=int, nargs="+", default=[1, 4, 16], help="catalog sizes, in snakes.json's")
+    parser.add_argument("--seed", type=int, default=0, help="seed for the made-up names and queries")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    real = sorted(catalog.index.names)
+
+    print(f"{'names':>8} {'scan ms':>10} {'index ms':>10} {'speedup':>8} {'candidates':>11} {'recall':>10}")
+
+    for scale in args.scales:
+        names = grow(real, scale, rng)
+        queries = [normalize_name(make_query(rng.choice(real), rng)) for _ in range(args.queries)]
+
+        index = TrigramIndex(names)
+        candidates = statistics.mean(len(index.candidates(query)) for query in queries)
+
+        scan_times, scan_results = timed(partial(linear_scan, names), queries)
+        index_times, index_results = timed(partial(indexed, index), queries)
+
+        # The index keeps one of the names that only differ in case, so compare them normalized
+        found = [({normalize_name(name) for name in a}, {normalize_name(name) for name in b})
+                 for a, b in zip(scan_results, index_results)]
+        recall = sum(len(a & b) for a, b in found) / max(1, sum(len(a) for a, _ in found))
+        scan_ms = statistics.mean(scan_times) * 1000
+        index_ms = statistics.mean(index_times) * 1000
+
+        print(
+            f"{len(names):>8} {scan_ms:>10.3f} {index_ms:>10.3f} {scan_ms / index_ms:>7.1f}x "
+            f"{candidates:>11.1f} {recall:>10.1%}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+# coding=utf-8
+"""
+Microbenchmarks parsing Python-style command calls, like `bot.snakes.get("black mamba")`, per message.
+
+Each message is read the way discord.py reads it - the command name, then every argument - once with the
+tokenizing parser the bot uses now and once with the old `get_word`, which ran `ast.literal_eval` over the rest
+of the message twice and rewrote the buffer. Besides typical calls, there are long and adversarial ones:
+
+    python -m benchmarks.parsing --repeat 2000
+"""
+
+import argparse
+import ast
+import logging
+import statistics
+import time
+from typing import Callable, List
+
+from discord.ext.commands import UserInputError
+from discord.ext.commands.view import StringView
+
+import bot  # noqa: F401 - patches StringView with the new parser
+
+log = logging.getLogger(__name__)
+
+MESSAGES = {
+    "plain": 'bot.snakes.get black mamba',
+    "call": 'bot.snakes.get("black mamba")',
+    "empty call": 'bot.snakes.get()',
+    "two args": "bot.tags.set(\"test\", 'a dark, dark night')",
+    "long string": 'bot.snakes.get("' + "a" * 1900 + '")',
+    "many args": "bot.snakes.get(" + ", ".join(f'"{i}"' for i in range(300)) + ")",
+    "unclosed": 'bot.snakes.get("' + "a" * 1900,
+    "nested": "bot.snakes.get(" + "(" * 900 + ")" * 900 + ")",
+}
+
+# What reading a message can fail with - discord.py's own parsing errors, and whatever the old `get_word`
+# let `ast.literal_eval` raise on values it can't evaluate
+PARSE_ERRORS = (UserInputError, ValueError, MemoryError, RecursionError)
+
+
+def legacy_get_word(self) -> str:
+    """
+    The old `get_word`, as it was before the tokenizing parser.
+    """
+
+    pos = 0
+    while not self.eof:
+        try:
+            current = self.buffer[self.index + pos]
+            if current.isspace() or current == "(":
+                break
+            pos += 1
+        except IndexError:
+            break
+
+    self.previous = self.index
+    result = self.buffer[self.index:self.index + pos]
+    self.index += pos
+    next = None
+
+    if len(self.buffer) != self.index:
+        next = self.buffer[self.index + 1]
+
+    syntax_valid = True
+    try:
+        ast.literal_eval(self.buffer[self.index:])
+    except SyntaxError:
+        syntax_valid = False
+
+    python_parse_conditions = (
+        current == "("
+        and next
+        and next != ")"
+        and syntax_valid
+    )
+
+    if python_parse_conditions:
+        log.debug(f"A python-style command was used. Attempting to parse. Buffer is {self.buffer}. "
+                  "A step-by-step can be found in the trace log.")
+
+        args = ast.literal_eval(self.buffer[self.index:])
+
+        if isinstance(args, str):
+            args = (args,)
+
+        new_args = []
+        for arg in args:
+            if not isinstance(arg, str):
+                log.debug(f"{arg} is not a str, casting to str.")
+                arg = str(arg)
+
+            log.debug(f"Wrapping all args in double quotes.")  # noqa: F541
+            new_args.append(f'"{arg}"')
+
+        new_args = " ".join(new_args)
+        self.buffer = f"{self.buffer[:self.index]} {new_args}"
+        log.debug(f"Modified the buffer. New buffer is now {self.buffer}")
+
+        self.end = len(self.buffer)
+
+    elif current == "(" and next == ")":
+        pos += 2
+        result = self.buffer[self.previous:self.index + (pos + 2)]
+        self.index += 2
+
+    return result.lower()
+
+
+def read_message(message: str, get_word: Callable[[StringView], str]) -> List[str]:
+    """
+    Read a message like discord.py does: skip the prefix, get the command name, then read every argument.
+    """
+
+    view = StringView(message)
+    view.skip_string("bot.")
+    words = []
+
+    try:
+        words.append(get_word(view))
+
+        while True:
+            view.skip_ws()
+            if view.eof:
+                return words
+            words.append(view.get_quoted_word())
+    except PARSE_ERRORS:
+        # The message fails to parse here, so this is as far as the bot would read it
+        return words
+
+
+def measure(message: str, get_word: Callable[[StringView], str], repeat: int) -> float:
+    timings = []
+
+    for _ in range(repeat):
+        start = time.perf_counter()
+        read_message(message, get_word)
+        timings.append(time.perf_counter() - start)
+
+    return statistics.median(timings) * 1_000_000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Microbenchmark parsing Python-style command calls.")
+    parser.add_argument("--repeat", type=int, default=1000, help="times to parse every message")
+    args = parser.parse_args()
+
+    # The old parser logs at every step - measure it like it ran in production, with the logs filtered out
+    logging.getLogger().setLevel(logging.WARNING)
+
+    print(f"{'message':>12} {'length':>7} {'old us':>10} {'new us':>10} {'speedup':>8}")
+
+    for name, message in MESSAGES.items():
+        old = measure(message, legacy_get_word, args.repeat)
+        new = measure(message, StringView.get_word, args.repeat)
+        print(f"{name:>12} {len(message):>7} {old:>10.1f} {new:>10.1f} {old / new:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
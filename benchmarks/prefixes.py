@@ -0,0 +1,82 @@
+# coding=utf-8
+"""
+Microbenchmarks finding the command prefix of a message, for commands and for the chat messages the bot ignores.
+
+The old way tried every prefix in turn, lower-casing the whole message for every one of them. The prefix matcher
+the bot uses now walks a trie over the start of the message once:
+
+    python -m benchmarks.prefixes --repeat 20000
+"""
+
+import argparse
+import statistics
+import time
+from typing import Callable
+
+from discord.ext.commands.view import StringView
+
+from bot.prefixes import PrefixMatcher
+
+PREFIXES = (
+    ">>> self.", ">> self.", "> self.", "self.",
+    ">>> bot.", ">> bot.", "> bot.", "bot.",
+    ">>> ", ">> ", "> ",
+    ">>>", ">>", ">"
+)
+
+MESSAGES = {
+    "command": 'bot.snakes.get("black mamba")',
+    "quote": "> " + "quoting someone at length " * 20,
+    "short chat": "lol",
+    "long chat": "I can't believe how long this snake is " * 50,
+    "near miss": "boterham met kaas " * 50,
+}
+
+
+def legacy_find_prefix(content: str):
+    """
+    How the prefix used to be found: the old skip_string tried with every prefix, in order.
+    """
+
+    view = StringView(content)
+
+    for prefix in PREFIXES:
+        if view.buffer.lower()[view.index:view.index + len(prefix)] == prefix:
+            view.index += len(prefix)
+            return prefix
+    return None
+
+
+def measure(function: Callable[[str], object], content: str, repeat: int) -> float:
+    timings = []
+
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(content)
+        timings.append(time.perf_counter() - start)
+
+    return statistics.median(timings) * 1_000_000_000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Microbenchmark finding the command prefix of a message.")
+    parser.add_argument("--repeat", type=int, default=10000, help="times to check every message")
+    args = parser.parse_args()
+
+    matcher = PrefixMatcher(*PREFIXES)
+
+    def new_find_prefix(content: str):
+        view = StringView(content)
+        prefix = matcher.match(content)
+        return prefix is not None and view.skip_string(prefix)
+
+    print(f"{'message':>12} {'length':>7} {'old ns':>10} {'new ns':>10} {'speedup':>8}")
+
+    for name, content in MESSAGES.items():
+        old = measure(legacy_find_prefix, content, args.repeat)
+        new = measure(new_find_prefix, content, args.repeat)
+        print(f"{name:>12} {len(content):>7} {old:>10.0f} {new:>10.0f} {old / new:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
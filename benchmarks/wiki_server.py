@@ -0,0 +1,353 @@
+# coding=utf-8
+"""
+A local stand-in for Wikipedia's api.php, so the Wikipedia fetch path can be measured without going online.
+
+Page responses come from a recording of the real API when there is one, and are otherwise made up from
+the snakes in snakes.json - image info is always made up. Latency, errors and rate limiting can be injected,
+either from the command line or while the server is running by POSTing a JSON object to /_control, e.g.
+
+    curl -X POST localhost:8080/_control -d '{"latency": 0.2, "error_rate": 0.1}'
+
+Run `python -m benchmarks.wiki_server --help` for the options.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import random
+import time
+from typing import Any, Dict, Optional
+
+from aiohttp import ClientSession, web
+
+from bot.catalog import catalog
+from bot.wiki import API_URL, PAGE_PARAMS, PROP_CONTINUATIONS, normalize_query
+
+log = logging.getLogger(__name__)
+
+# Parameters that don't change what a response contains
+IGNORED_PARAMS = ('format', 'utf8', 'action')
+
+
+def recording_key(params: Dict[str, str]) -> str:
+    """
+    A stable key for a request, so equal requests find the same recorded response.
+    """
+
+    return "&".join(f"{key}={value}" for key, value in sorted(params.items()) if key not in IGNORED_PARAMS)
+
+
+class FakeWiki:
+    """
+    Makes up MediaWiki API responses for a set of article titles.
+
+    Every title gets a page with an introduction, a few sections, a couple of pictures and a map,
+    which is enough to exercise everything the Snakes cog does with a page.
+    """
+
+    def __init__(self, titles):
+        self.pages = {}
+        self.by_title = {}
+
+        for pageid, title in enumerate(sorted(set(titles)), start=1000):
+            page = {
+                "pageid": pageid,
+                "ns": 0,
+                "title": title,
+                "lastrevid": pageid * 10,
+                "fullurl": f"https://en.wikipedia.org/wiki/{title.replace(' ', '_')}",
+                "extract": self.make_extract(title),
+                "images": [
+                    {"ns": 6, "title": f"File:{title} 1.jpg"},
+                    {"ns": 6, "title": f"File:{title} 2.jpg"},
+                    {"ns": 6, "title": f"File:{title} distribution.png"},
+                    {"ns": 6, "title": "File:Commons-logo.svg"},
+                ],
+            }
+            self.pages[pageid] = page
+            self.by_title[normalize_query(title)] = page
+
+    @staticmethod
+    def make_extract(title: str) -> str:
+        body = f"The {title} is a species of snake. " * 8
+        sections = "".join(
+            f"\n\n\n== {heading} ==\n{body}\n\nA second paragraph about {heading.lower()}."
+            for heading in ("Taxonomy", "Description", "Distribution and habitat", "Behaviour", "Diet", "See also")
+        )
+        return f"{body}\n{body}{sections}"
+
+    def search(self, query: str) -> Optional[Dict[str, Any]]:
+        key = normalize_query(query)
+        page = self.by_title.get(key)
+
+        if page is None:
+            page = next((page for title, page in self.by_title.items() if key in title), None)
+        return page
+
+    def render(self, page: Dict[str, Any], props: set) -> Dict[str, Any]:
+        result = {"pageid": page["pageid"], "ns": 0, "title": page["title"]}
+
+        if "info" in props:
+            result.update(lastrevid=page["lastrevid"], fullurl=page["fullurl"])
+        if "extracts" in props:
+            result["extract"] = page["extract"]
+        if "images" in props:
+            result["images"] = page["images"]
+        return result
+
+    @staticmethod
+    def image_info(title: str, width: int) -> Dict[str, Any]:
+        name = title.partition(":")[2].replace(" ", "_")
+        mime = "image/svg+xml" if name.endswith(".svg") else "image/png" if name.endswith(".png") else "image/jpeg"
+
+        return {
+            "ns": 6,
+            "title": title,
+            "imageinfo": [{
+                "url": f"https://upload.wikimedia.org/wikipedia/commons/a/ab/{name}",
+                "thumburl": f"https://upload.wikimedia.org/wikipedia/commons/thumb/a/ab/{name}/{width}px-{name}",
+                "mime": mime,
+                "width": 1600,
+                "height": 1200,
+            }],
+        }
+
+    def query(self, params: Dict[str, str]) -> Dict[str, Any]:
+        """
+        Answer an `action=query` request.
+        """
+
+        props = set(params.get("prop", "").split("|")) - {""}
+
+        if props == {"imageinfo"}:
+            width = int(params.get("iiurlwidth", 400))
+            titles = params.get("titles", "").split("|")
+            return {"query": {"pages": {str(-index): self.image_info(title, width)
+                                        for index, title in enumerate(titles, start=1)}}}
+
+        if params.get("generator") == "search":
+            page = self.search(params.get("gsrsearch", ""))
+            pages = [(None, page)] if page else []
+        elif "pageids" in params:
+            pages = [(None, self.pages.get(int(pageid))) for pageid in params["pageids"].split("|")]
+        else:
+            titles = params.get("titles", "").split("|")
+            pages = [(title, self.by_title.get(normalize_query(title))) for title in titles]
+
+        result = {}
+        for index, (title, page) in enumerate(pages, start=1):
+            if page is None:
+                result[str(-index)] = {"ns": 0, "title": title or "", "missing": ""}
+            else:
+                result[str(page["pageid"])] = self.render(page, props)
+
+        return {"batchcomplete": "", "query": {"pages": result}} if result else {"batchcomplete": ""}
+
+
+class WikiServer:
+    """
+    The stand-in api.php, with its fault injection and request counters.
+
+    Attributes
+    -----------
+    latency: :class:`float`
+        Seconds added to every response.
+    jitter: :class:`float`
+        Up to this many seconds are randomly added on top of the latency.
+    error_rate: :class:`float`
+        The fraction of requests answered with a 503.
+    rate_limit: Optional[:class:`int`]
+        Requests per second allowed before answering with a 429, or None for no limit.
+    """
+
+    def __init__(self, fake: FakeWiki, recordings: Optional[Dict[str, Any]] = None, *, latency: float = 0,
+                 jitter: float = 0, error_rate: float = 0, rate_limit: Optional[int] = None):
+        self.fake = fake
+        self.recordings = recordings or {}
+
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+
+        self.requests = 0
+        self.errors = 0
+        self.rate_limited = 0
+        self.replayed = 0
+
+        self._window = 0
+        self._window_count = 0
+
+        self.app = web.Application()
+        self.app.router.add_get("/w/api.php", self.api)
+        self.app.router.add_get("/_stats", self.get_stats)
+        self.app.router.add_post("/_control", self.control)
+
+    async def api(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        params = dict(request.query)
+
+        delay = self.latency + random.uniform(0, self.jitter)
+        if delay:
+            await asyncio.sleep(delay)
+
+        if self.rate_limit is not None:
+            window = int(time.monotonic())
+
+            if window != self._window:
+                self._window, self._window_count = window, 0
+
+            self._window_count += 1
+
+            if self._window_count > self.rate_limit:
+                self.rate_limited += 1
+                return web.Response(status=429, headers={"Retry-After": "1"}, text="Too many requests")
+
+        if random.random() < self.error_rate:
+            self.errors += 1
+            return web.Response(status=503, text="Injected error")
+
+        recorded = self.recordings.get(recording_key(params))
+        if recorded is not None:
+            self.replayed += 1
+            return web.json_response(recorded)
+
+        return web.json_response(self.fake.query(params))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "rate_limited": self.rate_limited,
+            "replayed": self.replayed,
+        }
+
+    async def get_stats(self, request: web.Request) -> web.Response:
+        return web.json_response(self.stats())
+
+    async def control(self, request: web.Request) -> web.Response:
+        """
+        Change the injected faults, or reset the counters with {"reset": true}.
+        """
+
+        settings = await request.json()
+
+        for name in ("latency", "jitter", "error_rate", "rate_limit"):
+            if name in settings:
+                setattr(self, name, settings[name])
+
+        if settings.get("reset"):
+            self.requests = self.errors = self.rate_limited = self.replayed = 0
+
+        return web.json_response({
+            "latency": self.latency,
+            "jitter": self.jitter,
+            "error_rate": self.error_rate,
+            "rate_limit": self.rate_limit,
+        })
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        """
+        Start serving in the current event loop.
+
+        :return: The URL of the stand-in api.php
+        """
+
+        loop = asyncio.get_event_loop()
+        self._handler = self.app.make_handler()
+        self._server = await loop.create_server(self._handler, host, port)
+
+        host, port = self._server.sockets[0].getsockname()[:2]
+        return f"http://{host}:{port}/w/api.php"
+
+    async def stop(self, timeout: float = 1.0):
+        """
+        Stop serving, giving open keep-alive connections `timeout` seconds to finish.
+        """
+
+        self._server.close()
+        await self._server.wait_closed()
+        await self._handler.shutdown(timeout)
+
+
+def load_titles():
+    return set(catalog.titles) | {"Python (programming language)"}
+
+
+async def record(fake: FakeWiki, path: str):
+    """
+    Record the real API's responses to the requests the Snakes cog makes for every snake, for replaying later.
+    """
+
+    recordings = {}
+
+    async with ClientSession() as session:
+        for page in fake.pages.values():
+            requests = [
+                {"generator": "search", "gsrsearch": page["title"], "gsrlimit": "1", **PAGE_PARAMS},
+                {"titles": page["title"], "redirects": "", **PAGE_PARAMS},
+            ]
+
+            for params in requests:
+                params = {"format": "json", "action": "query", "utf8": "", **params}
+
+                # Record the continuations for the page's properties too, like the client follows them
+                while True:
+                    async with session.get(API_URL, params=params) as response:
+                        data = await response.json()
+
+                    recordings[recording_key(params)] = data
+                    continuation = data.get("continue", {})
+
+                    if not any(key in continuation for key in PROP_CONTINUATIONS):
+                        break
+                    params.update(continuation)
+
+            log.info("Recorded %s", page["title"])
+
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(recordings, f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a local stand-in for Wikipedia's api.php.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--latency", type=float, default=0, help="seconds added to every response")
+    parser.add_argument("--jitter", type=float, default=0, help="up to this many extra seconds, at random")
+    parser.add_argument("--error-rate", type=float, default=0, help="fraction of requests answered with a 503")
+    parser.add_argument("--rate-limit", type=int, default=None, help="requests per second before answering 429")
+    parser.add_argument("--replay", metavar="FILE", help="serve responses recorded with --record")
+    parser.add_argument("--record", metavar="FILE", help="record responses from the real API, then exit")
+    args = parser.parse_args()
+
+    loop = asyncio.get_event_loop()
+    fake = FakeWiki(load_titles())
+
+    if args.record:
+        loop.run_until_complete(record(fake, args.record))
+        return
+
+    recordings = None
+    if args.replay:
+        with open(args.replay, encoding="utf-8") as f:
+            recordings = json.load(f)
+
+    server = WikiServer(
+        fake, recordings, latency=args.latency, jitter=args.jitter,
+        error_rate=args.error_rate, rate_limit=args.rate_limit
+    )
+    url = loop.run_until_complete(server.start(args.host, args.port))
+    log.info("Serving a stand-in api.php at %s", url)
+
+    try:
+        loop.run_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        loop.run_until_complete(server.stop())
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,14 @@
 # coding=utf-8
-import ast
 import logging
-import sys
-from logging import Logger, StreamHandler
+from collections import deque
+from logging import Logger
 
+import discord.ext.commands.core
 import discord.ext.commands.view
+from discord.ext.commands import BadArgument
+
+from bot.logs import Lazy, setup_logging
+from bot.parsing import CallSyntaxError, WORD_RE, parse_call
 
 
 logging.TRACE = 5
@@ -26,16 +30,6 @@ def monkeypatch_trace(self, msg, *args, **kwargs):
 
 Logger.trace = monkeypatch_trace
 
-# Set up logging
-logging_handlers = [StreamHandler(stream=sys.stderr)]
-
-logging.basicConfig(
-    format="%(asctime)s Bot: | %(name)30s | %(levelname)8s | %(message)s",
-    datefmt="%b %d %H:%M:%S",
-    level=logging.TRACE,
-    handlers=logging_handlers
-)
-
 log = logging.getLogger(__name__)
 
 # Silence discord and websockets
@@ -45,6 +39,9 @@ logging.getLogger("discord.state").setLevel(logging.ERROR)
 logging.getLogger("discord.http").setLevel(logging.ERROR)
 logging.getLogger("websockets.protocol").setLevel(logging.ERROR)
 
+# Set up logging - levels can be overridden per module from the environment, see setup_logging
+setup_logging()
+
 
 def _skip_string(self, string: str) -> bool:
     """
@@ -55,7 +52,7 @@ def _skip_string(self, string: str) -> bool:
     """
 
     strlen = len(string)
-    if self.buffer.lower()[self.index:self.index + strlen] == string:
+    if self.buffer[self.index:self.index + strlen].lower() == string.lower():
         self.previous = self.index
         self.index += strlen
         return True
@@ -64,7 +61,7 @@ def _skip_string(self, string: str) -> bool:
 
 def _get_word(self) -> str:
     """
-    Invokes the get_word method from
+    Our version of the get_word method from
     discord.ext.commands.view used to find
     the bot command part of a message, but
     allows the command to ignore case sensitivity,
@@ -75,90 +72,108 @@ def _get_word(self) -> str:
     bot.tags.set("test", 'a dark, dark night')
     bot.help(tags.delete)
     bot.hELP(tags.delete)
+
+    The arguments of a Python syntax call are parsed right away and handed
+    to the command one by one, instead of being read from the buffer.
     """
 
-    pos = 0
-    while not self.eof:
+    self.previous = self.index
+    self.index = WORD_RE.match(self.buffer, self.index).end()
+    result = self.buffer[self.previous:self.index].lower()  # Case insensitivity, baby
+
+    if self.index < self.end and self.buffer[self.index] == "(":
         try:
-            current = self.buffer[self.index + pos]
-            if current.isspace() or current == "(":
-                break
-            pos += 1
-        except IndexError:
-            break
+            arguments, end = parse_call(self.buffer, self.index)
+        except CallSyntaxError as e:
+            log.debug("A python-style command could not be parsed: %s", e)
+            self.syntax_error = BadArgument(f"Invalid syntax: {e}")
+            return result
+
+        log.trace(
+            "Parsed a python-style command into %d arguments: %s",
+            len(arguments), Lazy(lambda: ", ".join(map(repr, arguments)))
+        )
+        self.index = self.end
+
+        if not arguments:
+            # Commands called without arguments go by their name with the parentheses, like "snakes.get()"
+            return f"{result}()"
+
+        self.arguments = deque(arguments)
 
-    self.previous = self.index
-    result = self.buffer[self.index:self.index + pos]
-    self.index += pos
-    next = None
-
-    # Check what's after the '('
-    if len(self.buffer) != self.index:
-        next = self.buffer[self.index + 1]
-
-    # Is it possible to parse this without syntax error?
-    syntax_valid = True
-    try:
-        ast.literal_eval(self.buffer[self.index:])
-    except SyntaxError:
-        log.warning("The command cannot be parsed by ast.literal_eval because it raises a SyntaxError.")
-        # TODO: It would be nice if this actually made the bot return a SyntaxError. ClickUp #1b12z  # noqa: T000
-        syntax_valid = False
-
-    # Conditions for a valid, parsable command.
-    python_parse_conditions = (
-        current == "("
-        and next
-        and next != ")"
-        and syntax_valid
-    )
-
-    if python_parse_conditions:
-        log.debug(f"A python-style command was used. Attempting to parse. Buffer is {self.buffer}. "
-                  "A step-by-step can be found in the trace log.")
-
-        # Parse the args
-        log.trace("Parsing command with ast.literal_eval.")
-        args = self.buffer[self.index:]
-        args = ast.literal_eval(args)
-
-        # Force args into container
-        if isinstance(args, str):
-            args = (args,)
-
-        # Type validate and format
-        new_args = []
-        for arg in args:
-
-            # Other types get converted to strings
-            if not isinstance(arg, str):
-                log.trace(f"{arg} is not a str, casting to str.")
-                arg = str(arg)
-
-            # Adding double quotes to every argument
-            log.trace(f"Wrapping all args in double quotes.")
-            new_args.append(f'"{arg}"')
-
-        # Add the result to the buffer
-        new_args = " ".join(new_args)
-        self.buffer = f"{self.buffer[:self.index]} {new_args}"
-        log.trace(f"Modified the buffer. New buffer is now {self.buffer}")
-
-        # Recalibrate the end since we've removed commas
-        self.end = len(self.buffer)
-
-    elif current == "(" and next == ")":
-        # Move the cursor to capture the ()'s
-        log.debug("User called command without providing arguments.")
-        pos += 2
-        result = self.buffer[self.previous:self.index + (pos+2)]
-        self.index += 2
-
-    if isinstance(result, str):
-        return result.lower()  # Case insensitivity, baby
     return result
 
 
+def _check_syntax(self):
+    # Raised while the command is being prepared, so it goes through the usual error handling
+    if self.syntax_error is not None:
+        raise self.syntax_error
+
+
+async def _parse_arguments(self, ctx):
+    # Before any arguments are read, so a call with broken syntax doesn't run even if it takes no arguments
+    _check_syntax(ctx.view)
+    await _original_parse_arguments(self, ctx)
+
+
+def _skip_ws(self) -> bool:
+    _check_syntax(self)
+    return _original_skip_ws(self)
+
+
+def _eof(self) -> bool:
+    if self.arguments is not None:
+        return not self.arguments
+    return self.index >= self.end
+
+
+def _get_quoted_word(self):
+    _check_syntax(self)
+
+    if self.arguments is not None:
+        return self.arguments.popleft() if self.arguments else None
+    return _original_get_quoted_word(self)
+
+
+def _quoted_word(view):
+    _check_syntax(view)
+
+    if view.arguments is not None:
+        return view.arguments.popleft() if view.arguments else None
+    return _original_quoted_word(view)
+
+
+def _read_rest(self) -> str:
+    _check_syntax(self)
+
+    if self.arguments is not None:
+        rest = " ".join(self.arguments)
+        self.arguments.clear()
+        return rest
+    return _original_read_rest(self)
+
+
+StringView = discord.ext.commands.view.StringView
+
+_original_skip_ws = StringView.skip_ws
+_original_read_rest = StringView.read_rest
+_original_get_quoted_word = getattr(StringView, "get_quoted_word", None)
+_original_quoted_word = getattr(discord.ext.commands.core, "quoted_word", None)
+_original_parse_arguments = discord.ext.commands.core.Command._parse_arguments
+
 # Monkey patch the methods
-discord.ext.commands.view.StringView.skip_string = _skip_string
-discord.ext.commands.view.StringView.get_word = _get_word
+StringView.arguments = None  # Arguments of a Python syntax call, if the message is one
+StringView.syntax_error = None  # Why a Python syntax call couldn't be parsed, if it couldn't
+
+StringView.skip_string = _skip_string
+StringView.get_word = _get_word
+StringView.skip_ws = _skip_ws
+StringView.read_rest = _read_rest
+StringView.eof = property(_eof)
+discord.ext.commands.core.Command._parse_arguments = _parse_arguments
+
+# Depending on the version of discord.py, arguments are read by either of these
+if _original_get_quoted_word is not None:
+    StringView.get_quoted_word = _get_quoted_word
+if _original_quoted_word is not None:
+    discord.ext.commands.core.quoted_word = _quoted_word
@@ -0,0 +1,189 @@
+# coding=utf-8
+import logging
+import sys
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+log = logging.getLogger(__name__)
+
+# Returned by TTLCache.get when nothing is cached - None is a valid (negative) cached value
+MISSING = object()
+
+
+def estimate_size(value: Any) -> int:
+    """
+    Roughly estimate how many bytes a value takes up in memory, including anything it contains.
+
+    This only follows the builtin containers, which is all our cached values are made of.
+    """
+
+    size = sys.getsizeof(value)
+
+    if isinstance(value, dict):
+        size += sum(estimate_size(key) + estimate_size(item) for key, item in value.items())
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        size += sum(estimate_size(item) for item in value)
+
+    return size
+
+
+class TTLCache:
+    """
+    A least-recently-used cache whose entries expire after a time-to-live.
+
+    The cache is bounded both by number of entries and by the estimated size of its values in bytes,
+    evicting the least recently used entries first when either bound is exceeded.
+
+    Negative results (something we looked for and know doesn't exist) can be cached as None with
+    their own, usually shorter, time-to-live - use `MISSING` to tell those apart from a cache miss.
+
+    With `keep_stale`, expired entries are kept around until they're replaced or evicted,
+    so they can still be served with `stale` when nothing fresher can be had.
+
+    Attributes
+    -----------
+    max_entries: :class:`int`
+        The maximum number of entries in the cache.
+    max_bytes: Optional[:class:`int`]
+        The maximum estimated size of all cached values, or None for no limit.
+    ttl: :class:`float`
+        Seconds a value stays in the cache.
+    negative_ttl: :class:`float`
+        Seconds a negative (None) value stays in the cache.
+    keep_stale: :class:`bool`
+        Whether to keep expired entries for `stale`.
+    """
+
+    def __init__(self, max_entries: int = 1024, max_bytes: Optional[int] = None, ttl: float = 3600,
+                 negative_ttl: Optional[float] = None, keep_stale: bool = False,
+                 clock: Callable[[], float] = time.monotonic):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.negative_ttl = ttl if negative_ttl is None else negative_ttl
+        self.keep_stale = keep_stale
+        self.clock = clock
+
+        self._entries = OrderedDict()  # key -> (expires at, size, value)
+        self.bytes = 0
+
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable):
+        return self.peek(key) is not MISSING
+
+    def get(self, key: Hashable, default: Any = MISSING) -> Any:
+        """
+        Get a cached value and mark it as recently used.
+
+        :param key: The key to look up
+        :param default: What to return if the key isn't cached or has expired
+        :return: The cached value, which is None for a negative entry
+        """
+
+        value = self.peek(key)
+
+        if value is MISSING:
+            self.misses += 1
+            return default
+
+        self._entries.move_to_end(key)
+
+        if value is None:
+            self.negative_hits += 1
+        else:
+            self.hits += 1
+        return value
+
+    def peek(self, key: Hashable) -> Any:
+        """
+        Get a cached value without touching the statistics or the recently used order.
+        """
+
+        try:
+            expires, _, value = self._entries[key]
+        except KeyError:
+            return MISSING
+
+        if expires <= self.clock():
+            self.expirations += 1
+
+            if not self.keep_stale:
+                self.pop(key)
+            return MISSING
+
+        return value
+
+    def stale(self, key: Hashable) -> Any:
+        """
+        Get a cached value even if it has expired, as long as it's still being kept.
+        """
+
+        try:
+            return self._entries[key][2]
+        except KeyError:
+            return MISSING
+
+    def set(self, key: Hashable, value: Any, *, ttl: Optional[float] = None):
+        """
+        Cache a value, evicting the least recently used entries if the cache is full.
+
+        :param key: The key to cache the value under
+        :param value: The value to cache - None caches a negative result
+        :param ttl: Seconds to cache the value for, instead of the cache's default
+        """
+
+        if ttl is None:
+            ttl = self.negative_ttl if value is None else self.ttl
+
+        # Whatever was cached before is out of date, even if the new value can't be cached
+        self.pop(key)
+
+        size = estimate_size(value)
+        if self.max_bytes is not None and size > self.max_bytes:
+            log.debug("Not caching %r, its %d bytes would not fit in the cache", key, size)
+            return
+
+        self._entries[key] = (self.clock() + ttl, size, value)
+        self.bytes += size
+
+        while len(self._entries) > self.max_entries or (self.max_bytes is not None and self.bytes > self.max_bytes):
+            _, (_, evicted_size, _) = self._entries.popitem(last=False)
+            self.bytes -= evicted_size
+            self.evictions += 1
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        try:
+            _, size, value = self._entries.pop(key)
+        except KeyError:
+            return default
+
+        self.bytes -= size
+        return value
+
+    def clear(self):
+        self._entries.clear()
+        self.bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.negative_hits + self.misses
+        hit_rate = (self.hits + self.negative_hits) / lookups if lookups else 0
+
+        return {
+            "entries": len(self._entries),
+            "bytes": self.bytes,
+            "hits": self.hits,
+            "negative_hits": self.negative_hits,
+            "misses": self.misses,
+            "hit_rate": f"{hit_rate:.1%}",
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
@@ -0,0 +1,88 @@
+# coding=utf-8
+import logging
+import textwrap
+from typing import Any, Dict
+
+import discord
+
+from bot.wiki import iter_sections, parse_brief
+
+log = logging.getLogger(__name__)
+
+SNAKE_EMOJI_URL = "https://emojipedia-us.s3.amazonaws.com/thumbs/60/google/3/snake_1f40d.png"
+
+# Sections that don't tell you anything about the snake itself
+EXCLUDED_SECTIONS = ('see also', 'further reading', 'subspecies')
+
+# Discord's limits on embeds
+EMBED_MAX_FIELDS = 25
+EMBED_MAX_SIZE = 6000
+
+
+def make_card(data: Dict[str, Any], thumbnail: str = SNAKE_EMOJI_URL) -> Dict[str, Any]:
+    """
+    Parse a snake's page into everything that goes into its embed.
+
+    Pages from the store come with their sections already parsed. Otherwise they're parsed lazily,
+    and parsing stops as soon as the embed is full, so long articles don't cost any more than short ones.
+
+    :param data: A snake, as returned by `Snakes.get_snek`
+    :param thumbnail: The URL of the picture to show with the card
+    :return: The snake card - its title, URL, introduction, fields and thumbnail
+    """
+
+    if 'sections' in data:
+        # Parsed once already, when the page was stored
+        brief, sections = data['brief'], data['sections']
+    else:
+        brief, sections = parse_brief(data['extract']), iter_sections(data['extract'])
+
+    size = len(data['title']) + len(brief or "")
+    fields = []
+
+    for title, body in sections:
+        if title.lower() in EXCLUDED_SECTIONS:
+            continue
+        if not body.strip():
+            continue
+
+        # Only takes the first sentence
+        title, dot, _ = title.partition('.')
+        # There's probably a better way to do this
+        value = textwrap.shorten(body.strip(), width=200)
+
+        size += len(title) + len(dot) + len(value)
+        if size > EMBED_MAX_SIZE:
+            break
+
+        fields.append((title + dot, value))
+        if len(fields) == EMBED_MAX_FIELDS:
+            break
+
+    return {
+        "title": data['title'],
+        "url": data['fullurl'],
+        "brief": brief,
+        "fields": fields,
+        "thumbnail": thumbnail,
+    }
+
+
+def card_embed(card: Dict[str, Any]) -> discord.Embed:
+    """
+    Render a snake card as an embed.
+    """
+
+    embed = discord.Embed(
+        title=card['title'],
+        description=card['brief'],
+        url=card['url'],
+        colour=0x59982F
+    )
+
+    for name, value in card['fields']:
+        embed.add_field(name=name, value=value + '\n\u200b', inline=False)
+
+    embed.set_footer(text='Powered by Wikipedia')
+    embed.set_thumbnail(url=card['thumbnail'])
+    return embed
@@ -0,0 +1,128 @@
+# coding=utf-8
+import json
+import logging
+import os
+import random
+import sys
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+from bot.constants import SNAKE_PREFIX_MIN_LENGTH, SNAKE_SUGGESTIONS
+from bot.index import PrefixTrie, TrigramIndex, normalize_name
+
+log = logging.getLogger(__name__)
+
+# snakes.json lives at the root of the repository, wherever the bot is started from
+SNAKES_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "snakes.json")
+
+
+class SnakeCatalog:
+    """
+    Every snake we know about: the names people call them by, and the Wikipedia article each name is about.
+
+    Names are looked up normalized, so case and spacing don't matter, and every article knows all of
+    the names that lead to it. The articles are kept in a tuple, so picking random ones doesn't have to
+    build a list first.
+
+    Attributes
+    -----------
+    articles: Dict[:class:`str`, :class:`str`]
+        Maps every normalized name, article titles included, to its article title.
+    aliases: Dict[:class:`str`, Tuple[:class:`str`, ...]]
+        Maps every article title to the names that lead to it, the title itself included.
+    titles: Tuple[:class:`str`, ...]
+        Every article title, sorted.
+    index: :class:`TrigramIndex`
+        A trigram index over all of the names, for fuzzy matching.
+    prefixes: :class:`PrefixTrie`
+        A trie over all of the names, for exact and prefix matching and suggestions.
+    """
+
+    def __init__(self, snakes: Dict[str, str]):
+        self.articles = {}
+        aliases = defaultdict(list)
+
+        # Article titles lead to themselves, unless snakes.json says a title is another article's common name
+        for title in sorted(set(snakes.values())):
+            title = sys.intern(title)
+            self.articles[sys.intern(normalize_name(title))] = title
+            aliases[title].append(title)
+
+        for name, title in sorted(snakes.items()):
+            name, title = sys.intern(name), sys.intern(title)
+            self.articles[sys.intern(normalize_name(name))] = title
+
+            if name != title:
+                aliases[title].append(name)
+
+        self.aliases = {title: tuple(names) for title, names in aliases.items()}
+        self.titles = tuple(sorted(self.aliases))
+        self.index = TrigramIndex(name for names in self.aliases.values() for name in names)
+        self.prefixes = PrefixTrie(
+            {name: title for title, names in self.aliases.items() for name in names}, keep=SNAKE_SUGGESTIONS
+        )
+
+    @classmethod
+    def load(cls, path: str = SNAKES_PATH) -> "SnakeCatalog":
+        """
+        Load a catalog from a JSON file mapping names to article titles, like snakes.json.
+        """
+
+        with open(path, encoding="utf-8") as f:
+            catalog = cls(json.load(f))
+
+        log.debug("Loaded %d snakes under %d names from %s", len(catalog), len(catalog.articles), path)
+        return catalog
+
+    def __len__(self):
+        return len(self.titles)
+
+    def __contains__(self, name: str):
+        return normalize_name(name) in self.articles
+
+    def article(self, name: str) -> Optional[str]:
+        """
+        Get the article title for any of a snake's names.
+        """
+
+        return self.articles.get(normalize_name(name))
+
+    def resolve_prefix(self, name: str) -> Optional[str]:
+        """
+        Get the article a name or the start of one can only mean, without any fuzzy matching.
+
+        :param name: An exact name, or the start of one at least `SNAKE_PREFIX_MIN_LENGTH` characters long
+        :return: The article title, or None if the name matches nothing or could mean more than one article
+        """
+
+        name = normalize_name(name)
+        title = self.articles.get(name)
+
+        if title is None and len(name) >= SNAKE_PREFIX_MIN_LENGTH:
+            title = self.prefixes.unique(name)
+        return title
+
+    def suggest(self, query: str, k: int = SNAKE_SUGGESTIONS) -> List[str]:
+        """
+        Suggest names starting with what has been typed so far, shortest first.
+        """
+
+        return self.prefixes.complete(normalize_name(query), k)
+
+    def random(self) -> str:
+        """
+        Pick a random article title.
+        """
+
+        return random.choice(self.titles)
+
+    def sample(self, k: int) -> List[str]:
+        """
+        Pick `k` distinct random article titles.
+        """
+
+        return random.sample(self.titles, k)
+
+
+# Loaded once and shared by everything that needs to know about our snakes
+catalog = SnakeCatalog.load()
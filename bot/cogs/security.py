@@ -1,7 +1,15 @@
 # coding=utf-8
 import logging
+from collections import Counter
+from typing import Optional
 
-from discord.ext.commands import AutoShardedBot, Context
+import discord
+from discord import Message
+from discord.ext.commands import AutoShardedBot, Context, command
+
+from bot.constants import ADMIN_ROLE, COMMAND_IGNORED_CHANNELS, COMMAND_MAX_LENGTH, DEVOPS_ROLE, OWNER_ROLE
+from bot.decorators import with_role
+from bot.prefixes import PrefixMatcher
 
 log = logging.getLogger(__name__)
 
@@ -15,9 +23,68 @@ class Security:
         self.bot = bot
         self.bot.check(self.check_not_bot)  # Global commands check - no bots can run any commands at all
 
+        # Most messages aren't commands - drop those before discord.py starts parsing them
+        self.dropped = Counter()
+        self.passed = 0
+
+        self.process_commands = self.bot.process_commands
+        self.bot.process_commands = self.filter_commands
+
+    def __unload(self):
+        self.bot.process_commands = self.process_commands
+
     def check_not_bot(self, ctx: Context):
         return not ctx.author.bot
 
+    def drop_reason(self, message: Message) -> Optional[str]:
+        """
+        Why a message can't be a command we should run, cheapest checks first.
+
+        :return: The reason, or None if it could be a command
+        """
+        if message.author.bot:
+            return "bot author"
+
+        if message.channel.id in COMMAND_IGNORED_CHANNELS:
+            return "ignored channel"
+
+        if len(message.content) > COMMAND_MAX_LENGTH:
+            return "too long"
+
+        prefixes = self.bot.command_prefix
+        if isinstance(prefixes, PrefixMatcher) and not prefixes.matches(message.content):
+            return "no prefix"
+
+        return None
+
+    async def filter_commands(self, message: Message):
+        """
+        Stands in for the bot's process_commands, only passing on messages that could be commands.
+        """
+        reason = self.drop_reason(message)
+
+        if reason is not None:
+            self.dropped[reason] += 1
+            return
+
+        self.passed += 1
+        await self.process_commands(message)
+
+    @command(name="security.stats()", aliases=["security.stats"], hidden=True)
+    @with_role(OWNER_ROLE, ADMIN_ROLE, DEVOPS_ROLE)
+    async def stats(self, ctx: Context):
+        """
+        Shows how many messages were dropped before command parsing, and why.
+        """
+        total = self.passed + sum(self.dropped.values())
+        counts = [*self.dropped.most_common(), ("passed", self.passed)]
+        lines = "\n".join(f"{reason}: {count}" for reason, count in counts)
+
+        embed = discord.Embed(title="Message filter statistics", colour=0x59982F)
+        embed.add_field(name=f"{total} messages", value=f"```\n{lines}\n```", inline=False)
+
+        await ctx.send(embed=embed)
+
 
 def setup(bot):
     bot.add_cog(Security(bot))
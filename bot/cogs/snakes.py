@@ -3,20 +3,29 @@ import asyncio
 import logging
 import random
 import re
-import textwrap
-from typing import Any, Dict
+from typing import Any, Dict, List
 
-import aiohttp
-import async_timeout
 import discord
 from discord.ext.commands import AutoShardedBot, Context, command, bot_has_permissions
 
+from bot.cache import MISSING, TTLCache
+from bot.cards import SNAKE_EMOJI_URL, card_embed, make_card
+from bot.catalog import catalog
+from bot.constants import (
+    ADMIN_ROLE, DEVOPS_ROLE, GUESS_CHOICES, GUESS_ROUND_ATTEMPTS, OWNER_ROLE, SNAKE_EMBED_CACHE_SIZE,
+    SNAKE_EMBED_CACHE_TTL, SNAKE_IMAGE_MIN_SIZE, SNAKE_IMAGE_TYPES, SNAKE_STORE_PATH, SNAKE_STORE_REFRESH_INTERVAL
+)
 from bot.converters import Snake
-from bot.decorators import locked
+from bot.decorators import locked, with_role
+from bot.http import create_session, pool_stats
+from bot.pagination import PageUpdater
+from bot.rounds import RoundPool
+from bot.sessions import sessions
+from bot.store import PickStore, SnakeStore, prefetch, refresh
 from bot.utils import disambiguate
+from bot.wiki import API_URL, FALLBACK_PAGEID, UPSTREAM_ERRORS, WikiClient
 
 log = logging.getLogger(__name__)
-URL = "https://en.wikipedia.org/w/api.php?"
 
 
 class Snakes:
@@ -24,22 +33,71 @@ class Snakes:
     Snake-related commands
     """
 
-    # I really hope this works
-    wiki_sects = re.compile(r'(?:=+ (.*?) =+)(.*?\n\n)', flags=re.DOTALL)
-    wiki_brief = re.compile(r'(.*?)(=+ (.*?) =+)', flags=re.DOTALL)
+    # Wikipedia has arbitrary images that are not snakes
+    not_snakes = re.compile(r"Commons-logo|Red Pencil Icon|Death of Cleopatra|Head of holotype|Woma\.png|Adder \(PSF\)")
+    maps = re.compile(r"^File:Map|distribution|locator|-map\.|range\.", flags=re.IGNORECASE)
 
-    valid = ('gif', 'png', 'jpeg', 'jpg', 'webp')
-
-    def __init__(self, bot: AutoShardedBot):
+    def __init__(self, bot: AutoShardedBot, *, store_path: str = SNAKE_STORE_PATH, api_url: str = API_URL):
         self.bot = bot
 
-    async def fetch(self, session, url, params=None):
-        if params is None:
-            params = {}
+        # Share the bot's pooled session, so lookups reuse keep-alive connections to Wikipedia
+        self.session = getattr(bot, "http_session", None)
+        self.owns_session = self.session is None
+
+        if self.owns_session:
+            log.debug("The bot has no http_session, creating a pooled session for the Snakes cog")
+            self.session = create_session()
+
+        self.wiki = WikiClient(self.session, api_url=api_url)
+
+        # Local copy of every snake's page, so we can answer without waiting on Wikipedia
+        self.store = SnakeStore(store_path)
+        self.refresh_task = self.bot.loop.create_task(self.refresh_store())
+
+        # What people picked when a snake name was ambiguous, used by the Snake converter
+        self.picks = PickStore(store_path)
+
+        # Rendered snake cards, so a repeat get doesn't have to parse the page again
+        self.embeds = TTLCache(max_entries=SNAKE_EMBED_CACHE_SIZE, ttl=SNAKE_EMBED_CACHE_TTL)
+
+        # Guessing game rounds, prepared in the background
+        self.rounds = RoundPool(self.make_round)
+        self.rounds_task = self.bot.loop.create_task(self.fill_rounds())
+
+    def __unload(self):
+        self.refresh_task.cancel()
+        self.rounds_task.cancel()
+        self.store.close()
+        self.picks.close()
+        Snake.matcher.shutdown()
+
+        # The bot's session belongs to the bot - only close the one we made ourselves
+        if self.owns_session:
+            log.debug("Closing the Snakes cog's http session")
+            self.session.close()
+
+    @property
+    def store_titles(self):
+        """
+        Every article title we keep in the store.
+        """
+        return set(catalog.titles) | {'Python (programming language)'}
+
+    async def refresh_store(self):
+        """
+        Keep the snake store up to date in the background, fetching whatever is new or missing.
+        """
+        await self.bot.wait_until_ready()
+
+        while True:
+            try:
+                await refresh(self.store, self.wiki, self.store_titles)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                log.exception("Failed to refresh the snake store")
 
-        async with async_timeout.timeout(10):
-            async with session.get(url, params=params) as response:
-                return await response.json()
+            await asyncio.sleep(SNAKE_STORE_REFRESH_INTERVAL)
 
     async def get_snek(self, name: str) -> Dict[str, Any]:
         """
@@ -54,87 +112,60 @@ class Snakes:
         :param name: The name of the snake to get information for - omit for a random snake
         :return: A dict containing information on a snake
         """
-        snake_info = {}
+        # The store has every snake we know about - only unknown names need to go online
+        page = self.store.get(name)
 
-        async with aiohttp.ClientSession() as session:
-            params = {
-                'format': 'json',
-                'action': 'query',
-                'list': 'search',
-                'srsearch': name,
-                'utf8': '',
-                'srlimit': '1',
-            }
+        if page is None:
+            page = await self.wiki.lookup(name) or await self.wiki.page(FALLBACK_PAGEID)
 
-            json = await self.fetch(session, URL, params=params)
+        if page is None:
+            return {"error": True, "image_list": [], "map_list": []}
 
-            # wikipedia does have a error page
-            try:
-                pageid = json["query"]["search"][0]["pageid"]
-            except KeyError:
-                # Wikipedia error page ID(?)
-                pageid = 41118
-
-            params = {
-                'format': 'json',
-                'action': 'query',
-                'prop': 'extracts|images|info',
-                'exlimit': 'max',
-                'explaintext': '',
-                'inprop': 'url',
-                'pageids': pageid
-            }
-
-            json = await self.fetch(session, URL, params=params)
-
-            # constructing dict - handle exceptions later
-            try:
-                snake_info["title"] = json["query"]["pages"][f"{pageid}"]["title"]
-                snake_info["extract"] = json["query"]["pages"][f"{pageid}"]["extract"]
-                snake_info["images"] = json["query"]["pages"][f"{pageid}"]["images"]
-                snake_info["fullurl"] = json["query"]["pages"][f"{pageid}"]["fullurl"]
-                snake_info["pageid"] = json["query"]["pages"][f"{pageid}"]["pageid"]
-            except KeyError:
-                snake_info["error"] = True
-            if snake_info["images"]:
-                i_url = 'https://commons.wikimedia.org/wiki/Special:FilePath/'
-                image_list = []
-                map_list = []
-                thumb_list = []
-
-                # Wikipedia has arbitrary images that are not snakes
-                banned = [
-                    'Commons-logo.svg',
-                    'Red%20Pencil%20Icon.png',
-                    'distribution',
-                    'The%20Death%20of%20Cleopatra%20arthur.jpg',
-                    'Head%20of%20holotype',
-                    'locator',
-                    'Woma.png',
-                    '-map.',
-                    '.svg',
-                    'ange.',
-                    'Adder%20(PSF).png'
-                ]
-
-                for image in snake_info["images"]:
-                    # images come in the format of `File:filename.extension`
-                    file, sep, filename = image["title"].partition(':')
-                    filename = filename.replace(" ", "%20")  # Wikipedia returns good data!
-
-                    if not filename.startswith('Map'):
-                        if any(ban in filename for ban in banned):
-                            log.info("the image is banned")
-                        else:
-                            image_list.append(f"{i_url}{filename}")
-                            thumb_list.append(f"{i_url}{filename}?width=100")
-                    else:
-                        map_list.append(f"{i_url}{filename}")
-
-            snake_info["image_list"] = image_list
-            snake_info["map_list"] = map_list
-            snake_info["thumb_list"] = thumb_list
-        return snake_info
+        images, = await self.get_images(page)
+        return {**page, **images}
+
+    async def get_images(self, *pages: Dict[str, Any]) -> List[Dict[str, List[str]]]:
+        """
+        Find the pictures of snakes on one or more pages, and the maps of where they live.
+
+        The images of all the pages are resolved together, in as few requests as possible, and are judged
+        on their actual type and size rather than on what their file name looks like.
+
+        :param pages: Pages from the wiki client
+        :return: For each page, a dict with direct URLs to its snake pictures and its maps - and "image_error" set
+            if they couldn't be resolved, so they're only missing for now
+        """
+        titles = [title for page in pages for title in page["images"]]
+
+        try:
+            info = await self.wiki.image_info(titles)
+        except UPSTREAM_ERRORS:
+            log.warning("Failed to resolve images, carrying on without them", exc_info=True)
+            return [{"image_list": [], "map_list": [], "image_error": True} for _ in pages]
+
+        return [self.sort_images(page["images"], info) for page in pages]
+
+    def sort_images(self, titles: List[str], info: Dict[str, Any]) -> Dict[str, List[str]]:
+        """
+        Sort a page's resolved images into pictures of snakes and maps, leaving out everything else.
+        """
+        image_list = []
+        map_list = []
+
+        for title in titles:
+            image = info.get(title)
+
+            if image is None or image["mime"] not in SNAKE_IMAGE_TYPES:
+                continue
+
+            if self.maps.search(title):
+                map_list.append(image["thumburl"])
+            elif self.not_snakes.search(title):
+                log.trace("%s is not a snake", title)
+            elif min(image["width"], image["height"]) >= SNAKE_IMAGE_MIN_SIZE:
+                image_list.append(image["thumburl"])
+
+        return {"image_list": image_list, "map_list": map_list}
 
     @command(name="snakes.get()", aliases=["snakes.get"])
     @bot_has_permissions(manage_messages=True)
@@ -147,43 +178,83 @@ class Snakes:
         :param name: Optional, the name of the snake to get information for - omit for a random snake
         """
         if name is None:
-            name = Snake.random()
+            name = catalog.random()
 
-        data = await self.get_snek(name)
+        try:
+            data = await self.get_snek(name)
+        except UPSTREAM_ERRORS:
+            log.warning("Failed to get %r from Wikipedia", name, exc_info=True)
+            data = {'error': True}
 
         if data.get('error'):
             return await ctx.send('Could not fetch data from Wikipedia.')
 
-        match = self.wiki_brief.match(data['extract'])
-        embed = discord.Embed(
-            title=data['title'],
-            description=match.group(1) if match else None,
-            url=data['fullurl'],
-            colour=0x59982F
-        )
+        # Pages only change with their revision, so neither does their embed
+        key = (data['pageid'], data.get('revision'))
+        embed_data = self.embeds.get(key)
 
-        fields = self.wiki_sects.findall(data['extract'])
-        excluded = ('see also', 'further reading', 'subspecies')
+        if embed_data is MISSING:
+            image = next(iter(data['image_list']), SNAKE_EMOJI_URL)
+            embed = card_embed(make_card(data, thumbnail=image))
 
-        for title, body in fields:
-            if title.lower() in excluded:
-                continue
-            if not body.strip():
-                continue
-            # Only takes the first sentence
-            title, dot, _ = title.partition('.')
-            # There's probably a better way to do this
-            value = textwrap.shorten(body.strip(), width=200)
-            embed.add_field(name=title + dot, value=value + '\n\u200b', inline=False)
+            # Without its pictures the card is only a stand-in until they can be resolved again
+            if not data.get('image_error'):
+                self.embeds.set(key, embed.to_dict())
+        else:
+            embed = discord.Embed.from_data(embed_data)
+
+        await ctx.send(embed=embed)
 
-        embed.set_footer(text='Powered by Wikipedia')
+    @command(name="snakes.stats()", aliases=["snakes.stats"], hidden=True)
+    @with_role(OWNER_ROLE, ADMIN_ROLE, DEVOPS_ROLE)
+    async def stats(self, ctx: Context):
+        """
+        Shows statistics about the Wikipedia connection pool.
+        """
+        embed = discord.Embed(title="Snakes statistics", colour=0x59982F)
 
-        emoji = 'https://emojipedia-us.s3.amazonaws.com/thumbs/60/google/3/snake_1f40d.png'
-        image = next((url for url in data['image_list'] if url.endswith(self.valid)), emoji)
-        embed.set_thumbnail(url=image)
+        for section, values in self.get_stats().items():
+            lines = "\n".join(f"{key}: {value}" for key, value in values.items())
+            embed.add_field(name=section, value=f"```\n{lines or 'n/a'}\n```", inline=False)
 
         await ctx.send(embed=embed)
 
+    def get_stats(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Collect the statistics shown by the stats command, grouped by section.
+        """
+        reactions = getattr(self.bot, "reaction_router", None)
+        replies = getattr(self.bot, "reply_router", None)
+
+        return {
+            "HTTP pool": pool_stats(self.session),
+            **self.wiki.stats(),
+            "Snake store": self.store.stats(),
+            "Name resolution": Snake.stats(),
+            "Name cache": Snake.cache.stats(),
+            "Fuzzy matching": Snake.matcher.stats(),
+            "Disambiguation picks": self.picks.stats(),
+            "Embed cache": self.embeds.stats(),
+            "Guess rounds": self.rounds.stats(),
+            "Reaction router": reactions.stats() if reactions is not None else {},
+            "Reply router": replies.stats() if replies is not None else {},
+            "Paginator updates": PageUpdater.stats(),
+            "Interactive sessions": sessions.stats(),
+        }
+
+    @command(name="snakes.prefetch()", aliases=["snakes.prefetch"], hidden=True)
+    @with_role(OWNER_ROLE, ADMIN_ROLE, DEVOPS_ROLE)
+    @locked()
+    async def prefetch_store(self, ctx: Context):
+        """
+        Fetches every snake's Wikipedia page into the local snake store.
+        """
+        titles = self.store_titles
+        await ctx.send(f"Prefetching {len(titles)} pages...")
+
+        stored = await prefetch(self.store, self.wiki, titles=titles)
+        await ctx.send(f"Stored {stored} of {len(titles)} pages.")
+
     @command(hidden=True)
     async def zen(self, ctx):
         """
@@ -209,29 +280,57 @@ class Snakes:
             voice.disconnect(), loop=ctx.bot.loop
         ))
 
+    async def make_round(self) -> Dict[str, Any]:
+        """
+        Prepare a round of the guessing game: a few distinct snakes, one of which is pictured.
+
+        :return: A dict with the snakes to choose from, the correct answer, and the answer's picture
+        :raises RuntimeError: If none of the snakes sampled in GUESS_ROUND_ATTEMPTS tries had a usable picture
+        """
+        for _ in range(GUESS_ROUND_ATTEMPTS):
+            snakes = catalog.sample(GUESS_CHOICES)
+
+            # One request for all of them - we only need the images, so we can leave out the extracts
+            pages = await self.wiki.pages(titles=snakes, extracts=False)
+            found = {snake: page for snake, page in pages.items() if page is not None}
+
+            # And one more for all of their pictures
+            images = await self.get_images(*found.values())
+            candidates = {snake: data['image_list'][0] for snake, data in zip(found, images) if data['image_list']}
+
+            if candidates:
+                answer = random.choice(list(candidates))
+                return {"choices": snakes, "answer": answer, "image": candidates[answer]}
+
+        raise RuntimeError(f"Found no pictured snakes in {GUESS_ROUND_ATTEMPTS} tries")
+
+    async def fill_rounds(self):
+        """
+        Keep the guessing game's round pool topped up in the background.
+        """
+        await self.bot.wait_until_ready()
+        await self.rounds.run()
+
     @command(name="snakes.guess()", aliases=["snakes.guess", "identify"])
     @locked()
     async def guess(self, ctx):
         """
         Snake identifying game!
         """
-        image = None
-
-        while image is None:
-            snakes = [Snake.random() for _ in range(5)]
-            answer = random.choice(snakes)
-
-            data = await self.get_snek(answer)
-
-            image = next((url for url in data['image_list'] if url.endswith(self.valid)), None)
+        try:
+            round_ = await self.rounds.get()
+        except (RuntimeError, *UPSTREAM_ERRORS):
+            log.warning("Failed to make a guessing round", exc_info=True)
+            return await ctx.send('Could not fetch data from Wikipedia.')
 
         embed = discord.Embed(
             title='Which of the following is the snake in the image?',
             colour=random.randint(1, 0xFFFFFF)
         )
-        embed.set_image(url=image)
+        embed.set_image(url=round_['image'])
 
-        guess = await disambiguate(ctx, snakes, timeout=60, embed=embed)
+        answer = round_['answer']
+        guess = await disambiguate(ctx, round_['choices'], timeout=60, embed=embed)
 
         if guess == answer:
             return await ctx.send('You guessed correctly!')
@@ -25,3 +25,76 @@ BOT_AVATAR_URL = "https://raw.githubusercontent.com/discord-python/branding/mast
 
 # Bot internals
 HELP_PREFIX = "bot."
+COMMAND_MAX_LENGTH = 1000  # Longer messages are never treated as commands
+COMMAND_IGNORED_CHANNELS = ()  # Channels where messages are never treated as commands, e.g. (VERIFICATION_CHANNEL,)
+
+# Pagination
+PAGINATION_MAX_PAGES = 100  # Most laid out pages a paginator keeps in memory
+PAGINATION_EDIT_RATE = 1  # Message edits per second in a channel, sustained - Discord allows 5 every 5 seconds
+PAGINATION_EDIT_BURST = 5
+PAGINATION_EDIT_BUCKETS = 1024  # Channels whose edit rate limits are kept track of at once
+PAGINATION_EDIT_BUCKET_TTL = 60  # Seconds an unused channel's rate limit is kept - it's long since full again by then
+
+# Interactive sessions - paginators and prompts
+SESSIONS_MAX = 500  # Open at once across the bot - past this, the least recently used one is ended
+SESSIONS_MAX_PER_GUILD = 50
+
+# HTTP connection pool
+HTTP_POOL_LIMIT = 100  # Total simultaneous connections
+HTTP_POOL_LIMIT_PER_HOST = 10  # Simultaneous connections to a single host, e.g. en.wikipedia.org
+HTTP_KEEPALIVE_TIMEOUT = 60  # Seconds an idle connection is kept around for reuse
+HTTP_DNS_CACHE_TTL = 300  # Seconds a resolved address is cached for
+
+# Wikipedia response caches
+WIKI_SEARCH_CACHE_SIZE = 4096  # Normalised search strings -> pageids
+WIKI_SEARCH_CACHE_TTL = 24 * 60 * 60
+WIKI_PAGE_CACHE_SIZE = 1024  # Pageids -> parsed pages, comfortably fits every snake in snakes.json
+WIKI_PAGE_CACHE_BYTES = 64 * 1024 * 1024
+WIKI_PAGE_CACHE_TTL = 6 * 60 * 60
+WIKI_IMAGE_CACHE_SIZE = 8192  # Image titles -> direct URLs, types and sizes
+WIKI_IMAGE_CACHE_TTL = 24 * 60 * 60
+WIKI_NEGATIVE_CACHE_TTL = 10 * 60  # Searches and pages that came back empty
+WIKI_BATCH_LIMIT = 50  # Most titles or pageids the API accepts in a single request
+WIKI_THUMBNAIL_WIDTH = 400  # Width of the thumbnails we put in embeds
+
+# Snake pictures
+SNAKE_IMAGE_TYPES = ('image/jpeg', 'image/png', 'image/gif', 'image/webp')
+SNAKE_IMAGE_MIN_SIZE = 120  # Smaller pictures are usually icons, not snakes
+
+# Local snake store
+SNAKE_STORE_PATH = "snakes.db"  # Relative to the project, not the working directory
+SNAKE_STORE_REFRESH_INTERVAL = 24 * 60 * 60  # Seconds between checking the stored pages for new revisions
+SNAKE_STORE_PREFETCH_CONCURRENCY = 4  # Simultaneous page requests while filling the store
+
+# Snake name resolution
+SNAKE_NAME_CACHE_SIZE = 1024  # Normalized queries -> the names they matched
+SNAKE_NAME_CACHE_TTL = 24 * 60 * 60
+SNAKE_PREFIX_MIN_LENGTH = 3  # Shortest start of a name that resolves to a snake without fuzzy matching
+SNAKE_SUGGESTIONS = 10  # Names suggested for what has been typed so far
+SNAKE_MATCH_THRESHOLD = 80  # Lowest fuzzy score for a name to be a match
+SNAKE_MATCH_EXECUTOR = "thread"  # Where fuzzy matching runs, "thread" or "process" pool
+SNAKE_MATCH_WORKERS = 2
+SNAKE_MATCH_MARGIN = 10  # How far ahead of the runner-up the best match has to be to be picked without asking
+SNAKE_MATCH_CHOICES = 10  # Most matches to offer when we do have to ask
+SNAKE_MATCH_TIMEOUT = 60  # Seconds to wait for someone to pick a match
+
+# Snake cards
+SNAKE_EMBED_CACHE_SIZE = 1024  # Rendered embeds, keyed by pageid and revision
+SNAKE_EMBED_CACHE_TTL = 24 * 60 * 60
+
+# Snake guessing game
+GUESS_CHOICES = 5  # Snakes to choose from in a round
+GUESS_ROUND_ATTEMPTS = 3  # Samples of snakes to try before giving up on finding one with a picture
+GUESS_POOL_SIZE = 5  # Rounds kept ready to go
+GUESS_POOL_CONCURRENCY = 3  # Rounds prepared at the same time while refilling
+
+# Wikipedia client resilience
+WIKI_REQUEST_TIMEOUT = 5  # Seconds before a single attempt is given up on
+WIKI_RETRIES = 2  # Extra attempts after a 429, a 5xx or a network error
+WIKI_BACKOFF_BASE = 0.5  # Seconds, doubled for every retry and jittered
+WIKI_BACKOFF_MAX = 8
+WIKI_RETRY_AFTER_MAX = 30  # Longest Retry-After we'll wait out - anything longer fails straight away
+WIKI_RATE_LIMIT = 20  # Requests per second, sustained
+WIKI_RATE_BURST = 40  # Requests that can go out at once after a quiet spell
+WIKI_BREAKER_THRESHOLD = 5  # Consecutive failures before we stop asking Wikipedia
+WIKI_BREAKER_RESET = 30  # Seconds before we try Wikipedia again
@@ -1,49 +1,105 @@
-import json
-import random
+from collections import Counter
 
 import discord
 from discord.ext.commands import Converter
-from fuzzywuzzy import fuzz
 
+from bot.cache import MISSING, TTLCache
+from bot.catalog import catalog
+from bot.constants import (
+    SNAKE_MATCH_CHOICES, SNAKE_MATCH_MARGIN, SNAKE_MATCH_TIMEOUT, SNAKE_NAME_CACHE_SIZE, SNAKE_NAME_CACHE_TTL
+)
+from bot.index import normalize_name
+from bot.matching import FuzzyMatcher
 from bot.utils import disambiguate
 
 
 class Snake(Converter):
-    with open('snakes.json', 'r') as f:
-        snakes = json.load(f)
+    # The ranked matches for recent queries, so a repeat query doesn't have to be scored again
+    cache = TTLCache(max_entries=SNAKE_NAME_CACHE_SIZE, ttl=SNAKE_NAME_CACHE_TTL)
+
+    # Scores names in an executor, so conversions don't block the event loop
+    matcher = FuzzyMatcher()
+
+    # How conversions were resolved, for the stats command
+    outcomes = Counter()
 
     async def convert(self, ctx, name):
-        name = name.lower()
+        name = normalize_name(name)
 
         if name == 'python':
             return 'Python (programming language)'
 
-        def get_potential(iterable, *, threshold=80):
-            nonlocal name
-            potential = []
+        # Exact names, and starts of names that can only mean one snake, don't need fuzzy matching
+        title = catalog.resolve_prefix(name)
+        if title is not None:
+            self.outcomes['prefix'] += 1
+            return title
+
+        ranked = self.cache.get(name)
+        if ranked is MISSING:
+            ranked = tuple(await self.matcher.match(name, loop=ctx.bot.loop))
+            self.cache.set(name, ranked)
+
+        potential = [match for match, _ in ranked]
+
+        # A clear winner doesn't need a prompt
+        if len(ranked) == 1 or (len(ranked) > 1 and ranked[0][1] - ranked[1][1] >= SNAKE_MATCH_MARGIN):
+            self.outcomes['auto'] += 1
+            return catalog.article(potential[0]) or potential[0]
+
+        # Someone had to pick between these before - go with what they picked
+        picks = getattr(ctx.cog, 'picks', None)
+        scopes = self.pick_scopes(ctx)
 
-            for item in iterable:
-                original, item = item, item.lower()
+        if potential and picks is not None:
+            picked = picks.get(name, scopes)
 
-                if name == item:
-                    return [original]
+            if picked in potential:
+                self.outcomes['remembered'] += 1
+                return catalog.article(picked) or picked
 
-                a, b = fuzz.ratio(name, item), fuzz.partial_ratio(name, item)
-                if a >= threshold or b >= threshold:
-                    potential.append(original)
+        title = 'Found multiple choices. Please choose the correct one.'
 
-            return potential
+        if not potential:
+            # Nothing was close enough - offer the names starting with what was typed, if there are any
+            potential = catalog.suggest(name)
+            title = 'No exact match. Did you mean one of these?'
 
-        all_names = self.snakes.keys() | self.snakes.values()
-        timeout = len(all_names) * (3 / 4)
+            self.outcomes['suggested' if potential else 'unmatched'] += 1
+        else:
+            self.outcomes['prompted'] += 1
 
-        embed = discord.Embed(title='Found multiple choices. Please choose the correct one.', colour=0x59982F)
+        embed = discord.Embed(title=title, colour=0x59982F)
         embed.set_author(name=ctx.author.display_name, icon_url=ctx.author.avatar_url)
 
-        name = await disambiguate(ctx, get_potential(all_names), timeout=timeout, embed=embed)
-        return self.snakes.get(name, name)
+        choice = await disambiguate(
+            ctx, potential[:SNAKE_MATCH_CHOICES], timeout=SNAKE_MATCH_TIMEOUT, embed=embed
+        )
+
+        if picks is not None:
+            picks.put(name, choice, scopes)
+
+        return catalog.article(choice) or choice
+
+    @staticmethod
+    def pick_scopes(ctx):
+        """
+        Where to remember a disambiguation pick: the user's own picks first, then their guild's.
+        """
+        scopes = [f'user:{ctx.author.id}']
+
+        if ctx.guild is not None:
+            scopes.append(f'guild:{ctx.guild.id}')
+        return scopes
 
     @classmethod
-    def random(cls):
-        # list cast necessary because choice() uses indexing internally
-        return random.choice(list(cls.snakes.values()))
+    def stats(cls):
+        """
+        How many conversions were resolved which way - prefix, auto, remembered, prompted, suggested or unmatched.
+        """
+        total = sum(cls.outcomes.values())
+        return {outcome: f'{count} ({count / total:.1%})' for outcome, count in cls.outcomes.most_common()}
+
+    @staticmethod
+    def random():
+        return catalog.random()
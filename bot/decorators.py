@@ -13,17 +13,18 @@ log = logging.getLogger(__name__)
 def with_role(*role_ids: int):
     async def predicate(ctx: Context):
         if not ctx.guild:  # Return False in a DM
-            log.debug(f"{ctx.author} tried to use the '{ctx.command.name}'command from a DM. "
-                      "This command is restricted by the with_role decorator. Rejecting request.")
+            log.debug("%s tried to use the '%s' command from a DM. "
+                      "This command is restricted by the with_role decorator. Rejecting request.",
+                      ctx.author, ctx.command.name)
             return False
 
         for role in ctx.author.roles:
             if role.id in role_ids:
-                log.debug(f"{ctx.author} has the '{role.name}' role, and passes the check.")
+                log.debug("%s has the '%s' role, and passes the check.", ctx.author, role.name)
                 return True
 
-        log.debug(f"{ctx.author} does not have the required role to use "
-                  f"the '{ctx.command.name}' command, so the request is rejected.")
+        log.debug("%s does not have the required role to use "
+                  "the '%s' command, so the request is rejected.", ctx.author, ctx.command.name)
         return False
     return commands.check(predicate)
 
@@ -31,14 +32,15 @@ def with_role(*role_ids: int):
 def without_role(*role_ids: int):
     async def predicate(ctx: Context):
         if not ctx.guild:  # Return False in a DM
-            log.debug(f"{ctx.author} tried to use the '{ctx.command.name}' command from a DM. "
-                      "This command is restricted by the without_role decorator. Rejecting request.")
+            log.debug("%s tried to use the '%s' command from a DM. "
+                      "This command is restricted by the without_role decorator. Rejecting request.",
+                      ctx.author, ctx.command.name)
             return False
 
         author_roles = [role.id for role in ctx.author.roles]
         check = all(role not in author_roles for role in role_ids)
-        log.debug(f"{ctx.author} tried to call the '{ctx.command.name}' command. "
-                  f"The result of the without_role check was {check}.")
+        log.debug("%s tried to call the '%s' command. "
+                  "The result of the without_role check was %s.", ctx.author, ctx.command.name, check)
         return check
     return commands.check(predicate)
 
@@ -46,8 +48,8 @@ def without_role(*role_ids: int):
 def in_channel(channel_id):
     async def predicate(ctx: Context):
         check = ctx.channel.id == channel_id
-        log.debug(f"{ctx.author} tried to call the '{ctx.command.name}' command. "
-                  f"The result of the in_channel check was {check}.")
+        log.debug("%s tried to call the '%s' command. "
+                  "The result of the in_channel check was %s.", ctx.author, ctx.command.name, check)
         return check
     return commands.check(predicate)
 
@@ -0,0 +1,84 @@
+# coding=utf-8
+import logging
+from typing import Dict
+
+from aiohttp import AsyncResolver, ClientSession, TCPConnector
+
+from bot.constants import HTTP_DNS_CACHE_TTL, HTTP_KEEPALIVE_TIMEOUT, HTTP_POOL_LIMIT, HTTP_POOL_LIMIT_PER_HOST
+
+log = logging.getLogger(__name__)
+
+
+class PooledConnector(TCPConnector):
+    """
+    A TCPConnector that counts how many connections were asked for and how many had to be opened,
+    so we can tell how well the keep-alive pool is being reused.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.requested = 0
+        self.opened = 0
+
+    async def connect(self, *args, **kwargs):
+        self.requested += 1
+        return await super().connect(*args, **kwargs)
+
+    async def _create_connection(self, *args, **kwargs):
+        self.opened += 1
+        log.trace("Opening a new pooled connection")
+        return await super()._create_connection(*args, **kwargs)
+
+    def stats(self) -> Dict[str, int]:
+        """
+        A snapshot of the pool: how many connections were requested, opened and reused,
+        how many are in use right now, and how many are idle and waiting to be reused.
+        """
+
+        return {
+            "requested": self.requested,
+            "opened": self.opened,
+            "reused": self.requested - self.opened,
+            "acquired": len(self._acquired),
+            "idle": sum(len(conns) for conns in self._conns.values()),
+            "limit": self.limit,
+            "limit_per_host": self.limit_per_host,
+        }
+
+
+def create_session(*, limit: int = HTTP_POOL_LIMIT, limit_per_host: int = HTTP_POOL_LIMIT_PER_HOST,
+                   keepalive_timeout: float = HTTP_KEEPALIVE_TIMEOUT,
+                   dns_cache_ttl: int = HTTP_DNS_CACHE_TTL) -> ClientSession:
+    """
+    Create an aiohttp session backed by a keep-alive connection pool.
+
+    DNS resolution goes through asyncio instead of threads, and resolved addresses are cached,
+    so repeated requests to the same host skip both the DNS lookup and the TCP+TLS handshake.
+
+    :param limit: Maximum number of simultaneous connections
+    :param limit_per_host: Maximum number of simultaneous connections to a single host
+    :param keepalive_timeout: Seconds an idle connection is kept open for reuse
+    :param dns_cache_ttl: Seconds a resolved address is cached for
+    :return: A new ClientSession - whoever creates it is responsible for closing it
+    """
+
+    connector = PooledConnector(
+        resolver=AsyncResolver(),
+        limit=limit,
+        limit_per_host=limit_per_host,
+        keepalive_timeout=keepalive_timeout,
+        use_dns_cache=True,
+        ttl_dns_cache=dns_cache_ttl
+    )
+    return ClientSession(connector=connector)
+
+
+def pool_stats(session: ClientSession) -> Dict[str, int]:
+    """
+    Connection pool statistics for a session, if it was made by `create_session`.
+    """
+
+    connector = session.connector
+    if isinstance(connector, PooledConnector):
+        return connector.stats()
+    return {}
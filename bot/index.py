@@ -0,0 +1,248 @@
+# coding=utf-8
+import logging
+from collections import defaultdict
+from typing import Any, Dict, FrozenSet, Iterable, List, Optional
+
+from bot.cache import MISSING
+
+log = logging.getLogger(__name__)
+
+
+def normalize_name(name: str) -> str:
+    """
+    Normalize a name for matching: lower case, with runs of whitespace collapsed into single spaces.
+    """
+
+    return " ".join(name.lower().split())
+
+
+def trigrams(name: str) -> FrozenSet[str]:
+    """
+    The character trigrams of an already normalized name, padded with a space on either side
+    so that short names and the start and end of a name still have trigrams of their own.
+    """
+
+    padded = f" {name} "
+    return frozenset(padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+class TrigramIndex:
+    """
+    An inverted index from character trigrams to names, for narrowing a fuzzy search down to a few candidates.
+
+    Scoring a query against every name with fuzzywuzzy is linear in the number of names, and most of them
+    have nothing in common with the query. The index only hands out names that share a good part of their
+    trigrams with the query, so the expensive scoring runs on a handful of names instead of all of them.
+
+    Overlap is measured against the shorter of the two names, so a query that is a part of a longer name
+    (like "viper" in "Gaboon viper") is still a candidate, the same way `fuzz.partial_ratio` matches it.
+
+    Attributes
+    -----------
+    names: List[:class:`str`]
+        The names in the index, as they were given.
+    normalized: List[:class:`str`]
+        The normalized form of every name, at the same positions.
+    min_overlap: :class:`float`
+        The fraction of trigrams a name has to share with a query to be a candidate.
+    """
+
+    def __init__(self, names: Iterable[str], *, min_overlap: float = 0.3):
+        self.min_overlap = min_overlap
+
+        self.names = []
+        self.normalized = []
+        self._sizes = []
+        self._exact = {}
+        self._postings = defaultdict(list)  # trigram -> positions of the names that have it
+
+        for name in names:
+            self.add(name)
+
+    def __len__(self):
+        return len(self.names)
+
+    def add(self, name: str):
+        normalized = normalize_name(name)
+
+        if normalized in self._exact:
+            return
+
+        position = len(self.names)
+        grams = trigrams(normalized)
+
+        self.names.append(name)
+        self.normalized.append(normalized)
+        self._sizes.append(len(grams))
+        self._exact[normalized] = position
+
+        for gram in grams:
+            self._postings[gram].append(position)
+
+    def exact(self, query: str) -> Optional[str]:
+        """
+        Get the name that matches a query exactly once normalized, if there is one.
+        """
+
+        position = self._exact.get(normalize_name(query))
+        return None if position is None else self.names[position]
+
+    def candidates(self, query: str) -> List[int]:
+        """
+        Find the names that share enough trigrams with a query to possibly be a fuzzy match.
+
+        :param query: The query, already normalized
+        :return: The positions of the candidate names, most shared trigrams first
+        """
+
+        grams = trigrams(query)
+        shared = defaultdict(int)
+
+        for gram in grams:
+            for position in self._postings.get(gram, ()):
+                shared[position] += 1
+
+        size = len(grams)
+        sizes = self._sizes
+        overlap = self.min_overlap
+
+        found = [
+            position for position, count in shared.items()
+            if count >= overlap * min(size, sizes[position])
+        ]
+        found.sort(key=shared.__getitem__, reverse=True)
+        return found
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "names": len(self.names),
+            "trigrams": len(self._postings),
+            "postings": sum(len(positions) for positions in self._postings.values()),
+        }
+
+
+# Trie node value when the names below a node don't all have the same value
+MIXED = object()
+
+
+class _Node:
+    __slots__ = ("children", "name", "value", "top")
+
+    def __init__(self):
+        self.children = {}
+        self.name = None  # The name that ends here, if any
+        self.value = MISSING  # The value every name below here shares, or MIXED
+        self.top = []  # The best ranked names below here
+
+
+class PrefixTrie:
+    """
+    A trie over normalized names, for exact and prefix lookups that only cost as much as the query is long.
+
+    Every name is stored with a value, and every node knows whether all of the names below it share the
+    same value - so we can tell right away when a prefix can only mean one thing. Nodes also keep the
+    best few names below them, shortest first, for typeahead suggestions.
+
+    Attributes
+    -----------
+    keep: :class:`int`
+        How many suggestions every node keeps.
+    """
+
+    def __init__(self, names: Optional[Dict[str, Any]] = None, *, keep: int = 10):
+        self.keep = keep
+        self.root = _Node()
+        self.nodes = 1
+        self.size = 0
+
+        # Ranked insertion order means every node's suggestions end up best first
+        for name, value in sorted((names or {}).items(), key=lambda item: (len(item[0]), normalize_name(item[0]))):
+            self.add(name, value)
+
+    def __len__(self):
+        return self.size
+
+    def add(self, name: str, value: Any):
+        """
+        Add a name to the trie. Names added earlier rank higher in suggestions.
+        """
+
+        normalized = normalize_name(name)
+        node = self.root
+        path = [node]
+
+        for char in normalized:
+            child = node.children.get(char)
+
+            if child is None:
+                child = node.children[char] = _Node()
+                self.nodes += 1
+
+            node = child
+            path.append(node)
+
+        if node.name is not None:
+            return
+        node.name = name
+        self.size += 1
+
+        for node in path:
+            if node.value is MISSING:
+                node.value = value
+            elif node.value is not MIXED and node.value != value:
+                node.value = MIXED
+
+            if len(node.top) < self.keep:
+                node.top.append(name)
+
+    def _find(self, query: str) -> Optional[_Node]:
+        node = self.root
+
+        for char in query:
+            node = node.children.get(char)
+
+            if node is None:
+                return None
+        return node
+
+    def exact(self, query: str) -> Optional[str]:
+        """
+        Get the name that matches a normalized query exactly, if there is one.
+        """
+
+        node = self._find(query)
+        return None if node is None else node.name
+
+    def unique(self, query: str) -> Any:
+        """
+        Get the value of the names starting with a normalized query, if they all have the same one.
+
+        :return: The shared value, or None if no names start with the query or they have different values
+        """
+
+        node = self._find(query)
+
+        if node is None or node.value is MISSING or node.value is MIXED:
+            return None
+        return node.value
+
+    def complete(self, query: str, k: int = None) -> List[str]:
+        """
+        Suggest names starting with a normalized query, shortest first.
+
+        :param query: The normalized query
+        :param k: How many names to suggest, at most the trie's `keep`
+        :return: The suggested names
+        """
+
+        node = self._find(query)
+
+        if node is None:
+            return []
+        return node.top[:k]
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "names": self.size,
+            "nodes": self.nodes,
+        }
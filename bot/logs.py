@@ -0,0 +1,153 @@
+# coding=utf-8
+import atexit
+import logging
+import os
+import queue
+import sys
+import time
+from logging.handlers import QueueHandler, QueueListener
+from typing import Callable, Dict, Optional
+
+log = logging.getLogger(__name__)
+
+LOG_FORMAT = "%(asctime)s Bot: | %(name)30s | %(levelname)8s | %(message)s"
+LOG_DATE_FORMAT = "%b %d %H:%M:%S"
+
+
+class Lazy:
+    """
+    Defers computing a log argument until the record is actually handled.
+
+    Pass one as a %-style argument when working out the value is expensive - if the record is filtered out,
+    the function is never called:
+
+    >>> log.trace("Buffer is now %s", Lazy(lambda: describe(buffer)))
+    """
+
+    __slots__ = ("function",)
+
+    def __init__(self, function: Callable[[], object]):
+        self.function = function
+
+    def __str__(self):
+        return str(self.function())
+
+    def __repr__(self):
+        return repr(self.function())
+
+
+class DeferredQueueHandler(QueueHandler):
+    """
+    Puts records on a queue, to be formatted and written by a `QueueListener` thread.
+
+    The message is resolved here, on the thread that logged it - its arguments (and any `Lazy` ones) are often
+    objects the event loop keeps changing, and they shouldn't be kept alive in the queue either. Only laying out
+    the line and writing it happen on the listener thread. Unlike the standard `QueueHandler`, this doesn't
+    format the whole record up front, since ours never leaves the process.
+    """
+
+    exception_formatter = logging.Formatter()
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.msg = record.getMessage()
+        record.args = None
+
+        if record.exc_info:
+            # The traceback holds on to every frame it went through
+            record.exc_text = self.exception_formatter.formatException(record.exc_info)
+            record.exc_info = None
+
+        return record
+
+
+class TraceRateLimit(logging.Filter):
+    """
+    Lets at most `rate` TRACE records a second through for every logger, and drops the rest.
+
+    Records at any other level always pass. Every second, the number of TRACE records dropped in the
+    last one is logged, so it's clear the output is incomplete.
+    """
+
+    def __init__(self, rate: int, clock: Callable[[], float] = time.monotonic):
+        super().__init__()
+        self.rate = rate
+        self.clock = clock
+
+        self.window = 0
+        self.counts = {}
+        self.dropped = 0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno != logging.TRACE:
+            return True
+
+        window = int(self.clock())
+        if window != self.window:
+            if self.dropped:
+                log.debug("Dropped %d TRACE records over the rate limit", self.dropped)
+
+            self.window = window
+            self.counts.clear()
+            self.dropped = 0
+
+        count = self.counts.get(record.name, 0) + 1
+        self.counts[record.name] = count
+
+        if count > self.rate:
+            self.dropped += 1
+            return False
+        return True
+
+
+def parse_levels(value: str) -> Dict[str, int]:
+    """
+    Parse per-module log levels, like "bot.pagination=DEBUG,discord.gateway=ERROR".
+    """
+
+    levels = {}
+
+    for item in filter(None, (item.strip() for item in value.split(","))):
+        name, _, level = item.partition("=")
+        levels[name.strip()] = logging.getLevelName(level.strip().upper())
+
+    return levels
+
+
+def setup_logging(level: Optional[str] = None, levels: Optional[str] = None, trace_rate: Optional[int] = None):
+    """
+    Set up logging: records are queued by whichever code logs them, and formatted and written to stderr
+    on a separate thread, so slow I/O never blocks the event loop.
+
+    Every setting comes from the environment unless given:
+
+    LOG_LEVEL - the root level, TRACE by default.
+    LOG_LEVELS - levels for single modules, like "bot.pagination=DEBUG,bot.wiki=INFO".
+    LOG_TRACE_RATE - most TRACE records a second per module, or 0 for no limit (the default).
+    """
+
+    level = level or os.environ.get("LOG_LEVEL", "TRACE")
+    levels = parse_levels(levels if levels is not None else os.environ.get("LOG_LEVELS", ""))
+    trace_rate = trace_rate if trace_rate is not None else int(os.environ.get("LOG_TRACE_RATE", 0))
+
+    stream = logging.StreamHandler(stream=sys.stderr)
+    stream.setFormatter(logging.Formatter(LOG_FORMAT, datefmt=LOG_DATE_FORMAT))
+
+    records = queue.Queue()
+    handler = DeferredQueueHandler(records)
+
+    if trace_rate:
+        handler.addFilter(TraceRateLimit(trace_rate))
+
+    root = logging.getLogger()
+    root.setLevel(logging.getLevelName(level.upper()))
+    root.addHandler(handler)
+
+    for name, module_level in levels.items():
+        logging.getLogger(name).setLevel(module_level)
+
+    listener = QueueListener(records, stream, respect_handler_level=True)
+    listener.start()
+
+    # Flush whatever is still queued when the bot exits
+    atexit.register(listener.stop)
+    return listener
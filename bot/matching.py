@@ -0,0 +1,151 @@
+# coding=utf-8
+import asyncio
+import logging
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+from fuzzywuzzy import fuzz
+
+from bot.catalog import catalog
+from bot.constants import SNAKE_MATCH_EXECUTOR, SNAKE_MATCH_THRESHOLD, SNAKE_MATCH_WORKERS
+from bot.index import TrigramIndex
+
+log = logging.getLogger(__name__)
+
+
+def rank_names(name: str, *, threshold: int = SNAKE_MATCH_THRESHOLD,
+               index: Optional[TrigramIndex] = None) -> Tuple[Tuple[str, float], ...]:
+    """
+    Fuzzy match a name against every name in the catalog, best matches first.
+
+    This is CPU-bound, so it's meant to run in an executor - the whole query is scored in one call there,
+    and only the names that pass the threshold come back. Process pool workers import this module,
+    and with it the catalog, once, so the names never have to be sent to them.
+
+    Names are ranked by the average of their `fuzz.ratio` and `fuzz.partial_ratio`, so a name that contains
+    the query and is about as long as it ranks above one that merely contains it.
+
+    :param name: The normalized name to match
+    :param threshold: The lowest `fuzz.ratio` or `fuzz.partial_ratio` a name needs to be a match
+    :param index: The index to match against, instead of the catalog's
+    :return: Pairs of matching names and their combined scores, best first
+    """
+
+    if index is None:
+        index = catalog.index
+
+    exact = index.exact(name)
+    if exact is not None:
+        return (exact, 100),
+
+    names = index.names
+    normalized = index.normalized
+    ratio, partial_ratio = fuzz.ratio, fuzz.partial_ratio
+    ranked = []
+
+    # Only score the names that share enough trigrams with the query to possibly pass the threshold
+    for position in index.candidates(name):
+        a, b = ratio(name, normalized[position]), partial_ratio(name, normalized[position])
+
+        if a >= threshold or b >= threshold:
+            ranked.append((names[position], (a + b) / 2))
+
+    ranked.sort(key=lambda match: match[1], reverse=True)
+    return tuple(ranked)
+
+
+class FuzzyMatcher:
+    """
+    Runs fuzzy name matching in an executor, so scoring names doesn't hold up the event loop - and with it
+    the heartbeats and commands of every shard.
+
+    The executor is a thread pool or a process pool, made the first time it's needed. Shutting it down only stops
+    the current pool - the next match starts a new one - so a matcher shared by every `Snake` converter keeps
+    working when the cog that shut it down is loaded again.
+
+    Attributes
+    -----------
+    kind: :class:`str`
+        "thread" or "process".
+    workers: :class:`int`
+        How many names can be matched at the same time.
+    """
+
+    def __init__(self, kind: str = SNAKE_MATCH_EXECUTOR, workers: int = SNAKE_MATCH_WORKERS):
+        if kind not in ("thread", "process"):
+            raise ValueError(f"Unknown executor kind {kind!r}, expected 'thread' or 'process'")
+
+        self.kind = kind
+        self.workers = workers
+        self.executor = None
+
+        self.pools = 0
+        self.matches = 0
+        self.in_flight = 0
+        self.seconds = 0.0
+
+    def get_executor(self) -> Executor:
+        if self.executor is None:
+            log.debug("Starting a %s pool with %d workers for fuzzy matching", self.kind, self.workers)
+            pool = ProcessPoolExecutor if self.kind == "process" else ThreadPoolExecutor
+            self.executor = pool(max_workers=self.workers)
+            self.pools += 1
+
+        return self.executor
+
+    async def match(self, name: str, *, loop: asyncio.AbstractEventLoop = None) -> List[Tuple[str, float]]:
+        """
+        Fuzzy match a normalized name against the catalog in the executor.
+
+        :return: Pairs of matching names and their scores, best first, with only the best name for every article
+        """
+
+        loop = loop or asyncio.get_event_loop()
+        start = time.perf_counter()
+        self.in_flight += 1
+
+        try:
+            try:
+                future = loop.run_in_executor(self.get_executor(), rank_names, name)
+            except RuntimeError:
+                # Our pool was shut down by something other than `shutdown` - start another one
+                log.debug("The fuzzy matching pool was shut down, starting a new one")
+                self.executor = None
+                future = loop.run_in_executor(self.get_executor(), rank_names, name)
+
+            ranked = await future
+        finally:
+            self.in_flight -= 1
+            self.matches += 1
+            self.seconds += time.perf_counter() - start
+
+        articles = set()
+        matches = []
+
+        for match, score in ranked:
+            article = catalog.article(match)
+
+            if article not in articles:
+                articles.add(article)
+                matches.append((match, score))
+
+        return matches
+
+    def shutdown(self):
+        """
+        Stop the pool, letting whatever it's matching finish - it's started again the next time it's needed.
+        """
+
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
+            self.executor = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "executor": f"{self.kind} x{self.workers}",
+            "pools_started": self.pools,
+            "matches": self.matches,
+            "in_flight": self.in_flight,
+            "average_ms": round(self.seconds / self.matches * 1000, 2) if self.matches else 0,
+        }
@@ -1,12 +1,24 @@
 # coding=utf-8
 import asyncio
 import logging
-from typing import Iterable, Optional
+from collections import Counter, OrderedDict
+from collections.abc import Sequence
+from copy import copy
+from typing import AsyncIterable, Dict, Iterable, Optional, Union
 
-from discord import Embed, Member, Reaction
+from discord import Embed, Member, Message, Reaction
 from discord.abc import User
 from discord.ext.commands import Context, Paginator
 
+from bot.cache import MISSING, TTLCache
+from bot.constants import (
+    PAGINATION_EDIT_BUCKETS, PAGINATION_EDIT_BUCKET_TTL, PAGINATION_EDIT_BURST, PAGINATION_EDIT_RATE,
+    PAGINATION_MAX_PAGES
+)
+from bot.resilience import TokenBucket
+from bot.routers import ReactionRouter, ReactionSession, WaitForSession
+from bot.sessions import Session, sessions
+
 LEFT_EMOJI = "\u2B05"
 RIGHT_EMOJI = "\u27A1"
 DELETE_EMOJI = "\u274c"
@@ -46,9 +58,15 @@ class LinePaginator(Paginator):
         self.suffix = suffix
         self.max_size = max_size - len(suffix)
         self.max_lines = max_lines
-        self._current_page = [prefix]
+        self.clear()
+
+    def clear(self):
+        """
+        Clears the paginator to have no pages, like a new one.
+        """
+        self._current_page = [self.prefix]
         self._linecount = 0
-        self._count = len(prefix) + 1  # prefix + newline
+        self._count = len(self.prefix) + 1  # prefix + newline
         self._pages = []
 
     def add_line(self, line='', *, empty=False):
@@ -94,23 +112,25 @@ class LinePaginator(Paginator):
             self._count += 1
 
     @classmethod
-    async def paginate(cls, lines: Iterable[str], ctx: Context, embed: Embed,
+    async def paginate(cls, lines: Union[Iterable[str], AsyncIterable[str]], ctx: Context, embed: Embed,
                        prefix: str = "", suffix: str = "", max_lines: Optional[int] = None, max_size: int = 500,
                        empty: bool = True, restrict_to_user: User = None, timeout: int=300,
-                       footer_text: str = None):
+                       footer_text: str = None, track_session: bool = True):
         """
         Use a paginator and set of reactions to provide pagination over a set of lines. The reactions are used to
         switch page, or to finish with pagination.
         When used, this will send a message using `ctx.send()` and apply a set of reactions to it. These reactions may
         be used to change page, or to remove pagination from the message. Pagination will also be removed automatically
         if no reaction is added for five minutes (300 seconds).
+        Pages are only laid out as they're needed, so the lines can come from a generator or an async iterator, which is
+        only read as far as the pages that are actually looked at.
         >>> embed = Embed()
         >>> embed.set_author(name="Some Operation", url=url, icon_url=icon)
         >>> await LinePaginator.paginate(
         ...     (line for line in lines),
         ...     ctx, embed
         ... )
-        :param lines: The lines to be paginated
+        :param lines: The lines to be paginated, from an iterable or an async iterable
         :param ctx: Current context object
         :param embed: A pre-configured embed to be used as a template for each page
         :param prefix: Text to place before each page
@@ -121,6 +141,8 @@ class LinePaginator(Paginator):
         :param restrict_to_user: A user to lock pagination operations to for this message, if supplied
         :param timeout: The amount of time in seconds to disable pagination of no reaction is added
         :param footer_text: Text to prefix the page number in the footer with
+        :param track_session: Whether to count towards the limits on open sessions - turn it off if the caller
+            already tracks a session that ends this one along with it
         """
 
         def event_check(reaction_: Reaction, user_: Member):
@@ -150,121 +172,460 @@ class LinePaginator(Paginator):
             )
 
         paginator = cls(prefix=prefix, suffix=suffix, max_size=max_size, max_lines=max_lines)
-        current_page = 0
-
-        for line in lines:
-            try:
-                paginator.add_line(line, empty=empty)
-            except Exception:
-                log.exception(f"Failed to add line to paginator: '{line}'")
-                raise  # Should propagate
-            else:
-                log.trace(f"Added line to paginator: '{line}'")
+        source = PageSource(lines, paginator, empty=empty)
 
-        log.debug(f"Paginator created with {len(paginator.pages)} pages")
+        # Lay out the first page - and, if there's more, the start of the second
+        await source.fill(1)
+        embed.description = source.page(0)
 
-        embed.description = paginator.pages[current_page]
-
-        if len(paginator.pages) <= 1:
+        if source.exhausted and source.count <= 1:
             if footer_text:
                 embed.set_footer(text=footer_text)
-                log.trace(f"Setting embed footer to '{footer_text}'")
+                log.trace("Setting embed footer to %r", footer_text)
 
             log.debug("There's less than two pages, so we won't paginate - sending single page on its own")
             return await ctx.send(embed=embed)
         else:
-            if footer_text:
-                embed.set_footer(text=f"{footer_text} (Page {current_page + 1}/{len(paginator.pages)})")
-            else:
-                embed.set_footer(text=f"Page {current_page + 1}/{len(paginator.pages)}")
-
-            log.trace(f"Setting embed footer to '{embed.footer.text}'")
+            embed.set_footer(text=source.footer(0, footer_text))
+            log.trace("Setting embed footer to %r", embed.footer.text)
 
             log.debug("Sending first page to channel...")
             message = await ctx.send(embed=embed)
 
-        log.debug("Adding emoji reactions to message...")
+        # Have the reactions on our message routed straight to us, if the bot can - otherwise use wait_for
+        router = ReactionRouter.of(ctx.bot)
+        session = router.open(message.id) if router is not None else WaitForSession(ctx.bot)
 
-        for emoji in PAGINATION_EMOJI:
-            # Add all the applicable emoji to the message
-            log.trace(f"Adding reaction: {repr(emoji)}")
-            await message.add_reaction(emoji)
+        try:
+            await cls._paginate_reactions(ctx, message, embed, source, event_check, session,
+                                          timeout, footer_text, track_session)
+        finally:
+            if router is not None:
+                router.close(message.id)
+
+            # Even when we're cancelled - e.g. because the prompt we're showing the choices of was evicted
+            log.debug("Ending pagination and removing all reactions...")
+            await asyncio.shield(asyncio.ensure_future(cls._clear_reactions(message)))
+
+    @staticmethod
+    async def _clear_reactions(message: Message):
+        try:
+            await message.clear_reactions()
+        except Exception as e:
+            log.debug("Failed to remove the pagination reactions: %s", e)
+
+    @classmethod
+    async def _paginate_reactions(cls, ctx: Context, message: Message, embed: Embed, source: "PageSource",
+                                  event_check, session: Union[ReactionSession, WaitForSession], timeout: int,
+                                  footer_text: Optional[str], track_session: bool):
+        """
+        Add the pagination reactions to the message, and change pages as they're used until we're done.
+        """
+
+        # The reactions are added, and the message edited, in the background - we can take reactions straight away
+        updater = PageUpdater(message, embed, source, footer_text)
+
+        # Count towards the limits on open sessions - if we're evicted to make room, we end like we timed out
+        if track_session:
+            guild_id = ctx.guild.id if ctx.guild is not None else None
+            tracked = sessions.open("paginator", guild_id, end=session.end, contents=lambda: source.retained)
+        else:
+            tracked = None
+
+        try:
+            await cls._navigate(source, updater, event_check, session, tracked, timeout)
+        finally:
+            if tracked is not None:
+                sessions.close(tracked)
+
+            await updater.close()
+
+    @staticmethod
+    async def _navigate(source: "PageSource", updater: "PageUpdater", event_check,
+                        session: Union[ReactionSession, WaitForSession], tracked: Optional[Session], timeout: int):
+        """
+        Change pages as the reactions are used until we're done.
+        """
+
+        current_page = 0
 
         while True:
             try:
-                reaction, user = await ctx.bot.wait_for("reaction_add", timeout=timeout, check=event_check)
-                log.trace(f"Got reaction: {reaction}")
+                reaction, user = await session.wait(event_check, timeout=timeout)
+                log.trace("Got reaction: %s", reaction)
             except asyncio.TimeoutError:
-                log.debug("Timed out waiting for a reaction")
+                if session.ended:
+                    log.debug("Ended to make room for newer sessions")
+                else:
+                    log.debug("Timed out waiting for a reaction")
                 break  # We're done, no reactions for the last 5 minutes
 
+            if tracked is not None:
+                tracked.touch()
+
             if reaction.emoji == DELETE_EMOJI:
                 log.debug("Got delete reaction")
                 break
 
             if reaction.emoji == FIRST_EMOJI:
-                await message.remove_reaction(reaction.emoji, user)
+                updater.remove(reaction.emoji, user)
                 current_page = 0
 
-                log.debug(f"Got first page reaction - changing to page 1/{len(paginator.pages)}")
-
-                embed.description = paginator.pages[current_page]
-                if footer_text:
-                    embed.set_footer(text=f"{footer_text} (Page {current_page + 1}/{len(paginator.pages)})")
-                else:
-                    embed.set_footer(text=f"Page {current_page + 1}/{len(paginator.pages)}")
-                await message.edit(embed=embed)
+                log.debug("Got first page reaction - changing to page 1")
+                updater.show(current_page)
 
             if reaction.emoji == LAST_EMOJI:
-                await message.remove_reaction(reaction.emoji, user)
-                current_page = len(paginator.pages) - 1
-
-                log.debug(f"Got last page reaction - changing to page {current_page + 1}/{len(paginator.pages)}")
+                updater.remove(reaction.emoji, user)
+                await source.fill(source.max_pages)
+                current_page = source.count - 1
 
-                embed.description = paginator.pages[current_page]
-                if footer_text:
-                    embed.set_footer(text=f"{footer_text} (Page {current_page + 1}/{len(paginator.pages)})")
-                else:
-                    embed.set_footer(text=f"Page {current_page + 1}/{len(paginator.pages)}")
-                await message.edit(embed=embed)
+                log.debug("Got last page reaction - changing to page %d/%d", current_page + 1, source.count)
+                updater.show(current_page)
 
             if reaction.emoji == LEFT_EMOJI:
-                await message.remove_reaction(reaction.emoji, user)
+                updater.remove(reaction.emoji, user)
 
                 if current_page <= 0:
                     log.debug("Got previous page reaction, but we're on the first page - ignoring")
                     continue
 
                 current_page -= 1
-                log.debug(f"Got previous page reaction - changing to page {current_page + 1}/{len(paginator.pages)}")
-
-                embed.description = paginator.pages[current_page]
-
-                if footer_text:
-                    embed.set_footer(text=f"{footer_text} (Page {current_page + 1}/{len(paginator.pages)})")
-                else:
-                    embed.set_footer(text=f"Page {current_page + 1}/{len(paginator.pages)}")
-
-                await message.edit(embed=embed)
+                log.debug("Got previous page reaction - changing to page %d", current_page + 1)
+                updater.show(current_page)
 
             if reaction.emoji == RIGHT_EMOJI:
-                await message.remove_reaction(reaction.emoji, user)
+                updater.remove(reaction.emoji, user)
+                await source.fill(current_page + 2)
 
-                if current_page >= len(paginator.pages) - 1:
+                if current_page >= source.count - 1:
                     log.debug("Got next page reaction, but we're on the last page - ignoring")
                     continue
 
                 current_page += 1
-                log.debug(f"Got next page reaction - changing to page {current_page + 1}/{len(paginator.pages)}")
+                log.debug("Got next page reaction - changing to page %d", current_page + 1)
+                updater.show(current_page)
 
-                embed.description = paginator.pages[current_page]
 
-                if footer_text:
-                    embed.set_footer(text=f"{footer_text} (Page {current_page + 1}/{len(paginator.pages)})")
-                else:
-                    embed.set_footer(text=f"Page {current_page + 1}/{len(paginator.pages)}")
+class PageSource:
+    """
+    Lays out a paginator's pages as they're needed, reading only as many lines as that takes.
+
+    The lines can come from any iterable or async iterable, so a generator is only read as far as the pages
+    someone actually looks at, and the first page is ready no matter how many lines there are. Where each page
+    starts is kept in a compact index, so jumping to a page never lays out the ones before it again.
+
+    Only `max_pages` laid out pages are kept, so a paginator left open for hours can't hold on to everything it was
+    given. When the lines are a sequence, the least recently shown pages make room for new ones, and are laid out
+    again from the index when they're shown again. Anything else can only be read once, so lines after the first
+    `max_pages` pages are never read, and the footer says the pages were truncated.
+
+    Attributes
+    -----------
+    paginator: :class:`LinePaginator`
+        Lays out the lines.
+    empty: :class:`bool`
+        Whether to place an empty line between each line.
+    max_pages: :class:`int`
+        The most laid out pages to keep.
+    count: :class:`int`
+        How many pages have been laid out so far.
+    offsets: List[:class:`int`]
+        The line each page laid out so far starts at.
+    exhausted: :class:`bool`
+        Whether every line has been read.
+    truncated: :class:`bool`
+        Whether there were lines left after the last page we'll lay out.
+    """
+
+    def __init__(self, lines: Union[Iterable[str], AsyncIterable[str]], paginator: LinePaginator,
+                 *, empty: bool = True, max_pages: int = PAGINATION_MAX_PAGES):
+        self.is_async = hasattr(lines, "__aiter__")
+        self.sequence = lines if isinstance(lines, Sequence) else None
+        self.lines = lines.__aiter__() if self.is_async else iter(lines)
+        self.paginator = paginator
+        self.empty = empty
+        self.max_pages = max_pages
+
+        self.count = 0
+        self.offsets = [0]
+        self.retained = OrderedDict()  # page index -> page, least recently shown first
+
+        self.read = 0  # Lines read so far
+        self.pending = 0  # Lines read into the page that hasn't been closed yet
+        self.exhausted = False
+        self.truncated = False
+
+    async def read_line(self) -> Optional[str]:
+        if not self.is_async:
+            return next(self.lines, None)
+
+        try:
+            return await self.lines.__anext__()
+        except StopAsyncIteration:
+            return None
+
+    async def fill(self, count: int) -> int:
+        """
+        Lay out pages until there are `count` of them, or there are no more to lay out.
+
+        :return: How many pages there are now
+        """
+
+        while self.count < count and not (self.exhausted or self.truncated):
+            line = await self.read_line()
+
+            if line is None:
+                self.exhausted = True
+
+                if self.pending:
+                    self.paginator.close_page()
+                    self.keep()
+                    log.trace("Laid out the last page, page %d", self.count)
+                break
+
+            try:
+                self.paginator.add_line(line, empty=self.empty)
+            except Exception:
+                log.exception("Failed to add line to paginator: %r", line)
+                raise  # Should propagate
+
+            self.read += 1
+
+            if not self.paginator._pages:
+                self.pending += 1
+                continue
+
+            # The line didn't fit, so it closed the page before it and starts the next one
+            self.offsets.append(self.read - 1)
+            self.keep()
+            log.trace("Laid out page %d", self.count)
+            self.pending = 1
+
+            if self.sequence is None and self.count >= self.max_pages:
+                log.debug("Stopped laying out pages at the limit of %d", self.max_pages)
+                self.truncated = True
+
+        return self.count
+
+    def keep(self):
+        """
+        Take the pages the paginator has closed, making room for them if there are too many.
+        """
+
+        for page in self.paginator._pages:
+            self.retained[self.count] = page
+            self.count += 1
+
+        self.paginator._pages.clear()
+        self.evict()
 
-                await message.edit(embed=embed)
+    def evict(self):
+        # Pages of lines we can't read again have to stay - there are never more than `max_pages` of them anyway
+        while self.sequence is not None and len(self.retained) > self.max_pages:
+            index, _ = self.retained.popitem(last=False)
+            log.trace("Dropped page %d to make room", index + 1)
 
-        log.debug("Ending pagination and removing all reactions...")
-        await message.clear_reactions()
+    def page(self, index: int) -> str:
+        """
+        Get a page that has been laid out, laying it out again if it was dropped to make room.
+        """
+
+        page = self.retained.get(index)
+
+        if page is None:
+            page = self.layout(index)
+            self.retained[index] = page
+            self.evict()
+        else:
+            self.retained.move_to_end(index)
+
+        return page
+
+    def layout(self, index: int) -> str:
+        """
+        Lay out a dropped page again from its lines, with a fresh copy of the paginator.
+        """
+
+        start = self.offsets[index]
+        end = self.offsets[index + 1] if index + 1 < len(self.offsets) else self.read
+        log.trace("Laying out page %d again from lines %d to %d", index + 1, start, end)
+
+        paginator = copy(self.paginator)
+        paginator.clear()
+
+        for line in self.sequence[start:end]:
+            paginator.add_line(line, empty=self.empty)
+
+        paginator.close_page()
+        return paginator._pages[0]
+
+    def footer(self, index: int, footer_text: Optional[str] = None) -> str:
+        """
+        The footer for a page, like "Page 2/5" - or "Page 2/5+" while we don't know how many pages there are,
+        and "Page 2/100+ (truncated)" when we stopped reading lines.
+        """
+
+        if self.exhausted:
+            total = self.count
+        elif self.truncated:
+            total = f"{self.count}+ (truncated)"
+        else:
+            # The lines read since the last page was closed start another one, and there may be more after it
+            total = f"{self.count + bool(self.pending)}+"
+
+        if footer_text:
+            return f"{footer_text} (Page {index + 1}/{total})"
+        return f"Page {index + 1}/{total}"
+
+
+class PageUpdater:
+    """
+    Sends a paginated message's reactions and page changes to Discord in the background.
+
+    Navigating only says which page should be shown and which reactions should be removed, and returns straight away.
+    One task does the rest, so the calls land in order: it edits the message to the latest page - however many pages
+    were flipped through while the last edit was going out - and removes every reaction it was asked to, once.
+    Edits to messages in the same channel share a `TokenBucket`, so we stay within Discord's limit for the channel
+    rather than running into it.
+
+    Attributes
+    -----------
+    message: :class:`discord.Message`
+        The message being paginated.
+    embed: :class:`discord.Embed`
+        The embed the pages are shown in.
+    source: :class:`PageSource`
+        Where the pages come from.
+    page: :class:`int`
+        The page that should be shown.
+    shown: :class:`int`
+        The page the message shows.
+    """
+
+    # channel id -> TokenBucket, shared by every paginator in the channel. An idle bucket is full again well within
+    # the TTL, so dropping it loses nothing
+    buckets = TTLCache(max_entries=PAGINATION_EDIT_BUCKETS, ttl=PAGINATION_EDIT_BUCKET_TTL)
+    totals = Counter()
+
+    def __init__(self, message: Message, embed: Embed, source: PageSource, footer_text: Optional[str] = None):
+        self.message = message
+        self.embed = embed
+        self.source = source
+        self.footer_text = footer_text
+
+        self.page = 0
+        self.shown = 0
+        self.removals = set()  # (emoji, user)
+        self.wake = asyncio.Event()
+
+        self.reactions = asyncio.ensure_future(self.add_reactions())
+        self.updates = asyncio.ensure_future(self.run())
+
+    def show(self, page: int):
+        """
+        Have the message show a page, as soon as we can edit it.
+        """
+
+        self.totals["navigations"] += 1
+        self.page = page
+        self.wake.set()
+
+    def remove(self, emoji: str, user: User):
+        """
+        Have someone's reaction removed from the message.
+        """
+
+        self.totals["removals_requested"] += 1
+        self.removals.add((emoji, user))
+        self.wake.set()
+
+    async def add_reactions(self):
+        log.debug("Adding emoji reactions to message...")
+
+        # One at a time, so they show up in order
+        for emoji in PAGINATION_EMOJI:
+            log.trace("Adding reaction: %r", emoji)
+
+            try:
+                await self.message.add_reaction(emoji)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                log.warning("Failed to add the pagination reactions: %s", e)
+                return
+
+    async def run(self):
+        while True:
+            await self.wake.wait()
+            self.wake.clear()
+
+            # Whatever goes wrong with one update, the next navigation should still get its own
+            try:
+                await self.update()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                log.exception("Failed to update a paginated message")
+
+    async def update(self):
+        if self.page != self.shown:
+            await self.edit()
+
+        if self.removals:
+            removals, self.removals = self.removals, set()
+            self.totals["removals"] += len(removals)
+
+            results = await asyncio.gather(
+                *(self.message.remove_reaction(emoji, user) for emoji, user in removals), return_exceptions=True
+            )
+
+            for result in results:
+                if isinstance(result, Exception):
+                    log.debug("Failed to remove a pagination reaction: %s", result)
+
+    def bucket(self) -> TokenBucket:
+        """
+        Get the edit rate limit for the message's channel, keeping it around for as long as it's being used.
+        """
+
+        channel_id = self.message.channel.id
+        bucket = self.buckets.get(channel_id)
+
+        if bucket is MISSING:
+            bucket = TokenBucket(PAGINATION_EDIT_RATE, PAGINATION_EDIT_BURST)
+
+        self.buckets.set(channel_id, bucket)
+        return bucket
+
+    async def edit(self):
+        await self.bucket().acquire()
+
+        # Whichever page was navigated to last, even while we were waiting on the bucket
+        page = self.page
+        self.embed.description = self.source.page(page)
+        self.embed.set_footer(text=self.source.footer(page, self.footer_text))
+
+        await self.message.edit(embed=self.embed)
+        self.totals["edits"] += 1
+        self.shown = page
+
+    async def close(self):
+        """
+        Stop updating the message, dropping any updates that haven't gone out yet.
+        """
+
+        for task in (self.reactions, self.updates):
+            task.cancel()
+
+        await asyncio.gather(self.reactions, self.updates, return_exceptions=True)
+
+    @classmethod
+    def stats(cls) -> Dict[str, int]:
+        return {
+            "navigations": cls.totals["navigations"],
+            "edits": cls.totals["edits"],
+            "coalesced": cls.totals["navigations"] - cls.totals["edits"],
+            "removals_requested": cls.totals["removals_requested"],
+            "removals": cls.totals["removals"],
+            "channels": len(cls.buckets),
+        }
@@ -0,0 +1,128 @@
+# coding=utf-8
+import ast
+import logging
+import re
+from typing import List, Tuple
+
+log = logging.getLogger(__name__)
+
+# One token of a Python-style call's argument list, after any leading whitespace.
+# None of the alternatives can backtrack into each other, so a whole argument list is tokenized in linear time.
+TOKEN_RE = re.compile(r"""
+    \s*
+    (?:
+        (?P<string>[rRuU]?(?:"[^"\\\n]*(?:\\.[^"\\\n]*)*"|'[^'\\\n]*(?:\\.[^'\\\n]*)*'))
+      | (?P<number>[-+]?(?:\d[\d_]*(?:\.[\d_]*)?|\.\d[\d_]*)(?:[eE][-+]?\d+)?)
+      | (?P<name>[^\W\d]\w*(?:\.[^\W\d]\w*)*)
+      | (?P<punctuation>[(),])
+      | (?P<end>\Z)
+    )
+""", re.VERBOSE)
+
+# Where the command name in front of the parentheses ends
+WORD_RE = re.compile(r"[^\s(]*")
+
+
+class CallSyntaxError(SyntaxError):
+    """
+    Raised when a Python-style call's argument list can't be parsed.
+
+    Like any `SyntaxError`, `msg` says what went wrong and `offset` where in the message, counting from 1.
+    """
+
+    def __str__(self):
+        return f"{self.msg} (at character {self.offset})"
+
+
+def syntax_error(msg: str, position: int) -> CallSyntaxError:
+    return CallSyntaxError(msg, ("<message>", 1, position + 1, None))
+
+
+def tokenize(buffer: str, index: int):
+    """
+    Tokenize a Python-style argument list, starting at its opening parenthesis.
+
+    :param buffer: The whole message
+    :param index: Where the opening parenthesis is
+    :return: A generator of (kind, text, position) tuples, ending with an "end" token
+    """
+
+    while True:
+        match = TOKEN_RE.match(buffer, index)
+
+        if match is None:
+            position = index + len(buffer[index:]) - len(buffer[index:].lstrip())
+            char = buffer[position]
+
+            if char in "\"'":
+                raise syntax_error("unterminated string", position)
+            raise syntax_error(f"unexpected character {char!r}", position)
+
+        kind = match.lastgroup
+        yield kind, match.group(kind), match.start(kind)
+
+        if kind == "end":
+            return
+        index = match.end()
+
+
+def parse_call(buffer: str, index: int) -> Tuple[List[str], int]:
+    """
+    Parse the arguments of a Python-style command call, like `bot.snakes.get("black mamba")`.
+
+    Arguments can be string literals, numbers, or bare (dotted) names like `True` or `tags.delete`,
+    separated by commas, with an optional trailing comma. Each argument is returned as the text it stands for,
+    which is what the command's converters expect. Only whitespace may follow the closing parenthesis.
+
+    :param buffer: The whole message
+    :param index: Where the opening parenthesis is
+    :return: The arguments, and where the call ends
+    :raises CallSyntaxError: If the arguments aren't valid
+    """
+
+    tokens = tokenize(buffer, index)
+    _, text, _ = next(tokens)
+
+    if text != "(":
+        raise syntax_error("expected '('", index)
+
+    arguments = []
+    expect_argument = True
+
+    for kind, text, position in tokens:
+        if kind == "end":
+            raise syntax_error("'(' was never closed", index)
+
+        if text == ")":
+            break
+
+        if expect_argument:
+            if kind == "string" and "\\" not in text and text[0] in "\"'":
+                # A string without a prefix or escapes is just what's between the quotes
+                arguments.append(text[1:-1])
+            elif kind == "string":
+                # The token is already known to be a complete literal, so this only has to decode it
+                try:
+                    arguments.append(ast.literal_eval(text))
+                except (SyntaxError, ValueError):
+                    raise syntax_error("invalid escape in string", position) from None
+            elif kind == "number":
+                arguments.append(text.replace("_", ""))
+            elif kind == "name":
+                arguments.append(text)
+            else:
+                raise syntax_error(f"expected an argument, got {text!r}", position)
+
+            expect_argument = False
+        elif text == ",":
+            expect_argument = True
+        else:
+            raise syntax_error(f"expected ',' or ')', got {text!r}", position)
+
+    end = position + 1
+    kind, text, position = next(tokens)
+
+    if kind != "end":
+        raise syntax_error(f"unexpected {text!r} after the closing parenthesis", position)
+
+    return arguments, end
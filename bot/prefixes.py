@@ -0,0 +1,90 @@
+# coding=utf-8
+import logging
+from typing import List, Optional
+
+from discord import Message
+from discord.ext.commands import AutoShardedBot, when_mentioned
+
+log = logging.getLogger(__name__)
+
+# Trie key for the prefix that ends at a node
+END = None
+
+
+class PrefixMatcher:
+    """
+    The bot's command prefixes, compiled into a case-insensitive trie.
+
+    Used as the bot's `command_prefix`, it finds the longest prefix a message starts with in a single pass
+    over the start of the message, and returns just that prefix - as it was typed - so discord.py doesn't have
+    to try every prefix in turn. Messages that start with none of them cost only as many steps as they share
+    with a prefix, no matter how long they are.
+
+    Mentioning the bot works as a prefix too, like with `when_mentioned_or`.
+    """
+
+    def __init__(self, *prefixes: str, mentions: bool = True):
+        self.prefixes = prefixes
+        self.mentions = mentions
+        self.trie = {}
+
+        for prefix in prefixes:
+            node = self.trie
+
+            for char in prefix.lower():
+                node = node.setdefault(char, {})
+            node[END] = prefix
+
+        self.matched = 0
+        self.ignored = 0
+
+    def match(self, content: str) -> Optional[str]:
+        """
+        Find the longest prefix some content starts with.
+
+        :return: The prefix as it appears in the content, or None
+        """
+
+        node = self.trie
+        length = 0
+
+        for index, char in enumerate(content):
+            node = node.get(char.lower())
+
+            if node is None:
+                break
+            if END in node:
+                length = index + 1
+
+        return content[:length] if length else None
+
+    def matches(self, content: str) -> bool:
+        """
+        Whether some content starts with a prefix or a mention, and so could be a command.
+        """
+
+        return (self.mentions and content.startswith("<@")) or self.match(content) is not None
+
+    def __call__(self, bot: AutoShardedBot, message: Message) -> List[str]:
+        content = message.content
+
+        if self.mentions and content.startswith("<@"):
+            self.matched += 1
+            return when_mentioned(bot, message)
+
+        prefix = self.match(content)
+
+        if prefix is None:
+            # discord.py wants at least one prefix - any of them will do, since we know none of them match
+            self.ignored += 1
+            return [self.prefixes[0]]
+
+        self.matched += 1
+        return [prefix]
+
+    def stats(self):
+        return {
+            "prefixes": len(self.prefixes),
+            "matched": self.matched,
+            "ignored": self.ignored,
+        }
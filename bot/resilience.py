@@ -0,0 +1,183 @@
+# coding=utf-8
+import asyncio
+import logging
+import random
+import time
+from email.utils import parsedate_to_datetime
+from typing import Any, Callable, Dict, Optional
+
+log = logging.getLogger(__name__)
+
+
+class CircuitOpenError(Exception):
+    """
+    Raised instead of making a request while the circuit breaker is open.
+    """
+
+
+class TokenBucket:
+    """
+    Rate limits something to a sustained number of calls per second, while allowing short bursts.
+
+    Attributes
+    -----------
+    rate: :class:`float`
+        Tokens added to the bucket per second.
+    capacity: :class:`float`
+        The most tokens the bucket can hold, which is the longest burst allowed.
+    """
+
+    def __init__(self, rate: float, capacity: float, clock: Callable[[], float] = time.monotonic):
+        self.rate = rate
+        self.capacity = capacity
+        self.clock = clock
+
+        self.tokens = capacity
+        self.updated = clock()
+
+        self.waits = 0
+        self.waited = 0.0
+
+    def _refill(self):
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        """
+        Take a token from the bucket, waiting for one to be added if it's empty.
+        """
+
+        self._refill()
+
+        while self.tokens < 1:
+            delay = (1 - self.tokens) / self.rate
+            self.waits += 1
+            self.waited += delay
+
+            await asyncio.sleep(delay)
+            self._refill()
+
+        self.tokens -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        self._refill()
+
+        return {
+            "tokens": f"{self.tokens:.1f}/{self.capacity}",
+            "rate": f"{self.rate}/s",
+            "waits": self.waits,
+            "waited_s": round(self.waited, 1),
+        }
+
+
+class CircuitBreaker:
+    """
+    Stops calls to something that keeps failing, so callers fail fast instead of waiting on it.
+
+    The breaker opens after `threshold` consecutive failures. Once `reset_timeout` seconds have passed,
+    a single trial call is let through - if it succeeds the breaker closes again, if not it stays open.
+    If the trial hasn't reported back after another `reset_timeout`, or was abandoned, another one is let through.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+    def __init__(self, threshold: int, reset_timeout: float, clock: Callable[[], float] = time.monotonic):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trial_at = 0.0
+
+        self.times_opened = 0
+        self.rejected = 0
+
+    def allow(self) -> bool:
+        """
+        Whether a call may go ahead right now.
+        """
+
+        if self.state == self.CLOSED:
+            return True
+
+        now = self.clock()
+
+        if self.state == self.OPEN and now >= self.opened_at + self.reset_timeout:
+            log.info("Circuit breaker is half-open, letting a trial call through")
+            self.state = self.HALF_OPEN
+            self.trial_at = now
+            return True
+
+        if self.state == self.HALF_OPEN and now >= self.trial_at + self.reset_timeout:
+            log.info("Circuit breaker trial call never finished, letting another one through")
+            self.trial_at = now
+            return True
+
+        self.rejected += 1
+        return False
+
+    def success(self):
+        if self.state != self.CLOSED:
+            log.info("Circuit breaker closed")
+
+        self.state = self.CLOSED
+        self.failures = 0
+
+    def release(self):
+        """
+        A call was abandoned before it had an outcome - if it was the half-open trial, let the next call be one.
+        """
+
+        if self.state == self.HALF_OPEN:
+            self.trial_at = self.clock() - self.reset_timeout
+
+    def failure(self):
+        self.failures += 1
+
+        if self.state == self.HALF_OPEN or (self.state == self.CLOSED and self.failures >= self.threshold):
+            log.warning("Circuit breaker opened after %d consecutive failures", self.failures)
+            self.state = self.OPEN
+            self.opened_at = self.clock()
+            self.times_opened += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "failures": self.failures,
+            "times_opened": self.times_opened,
+            "rejected": self.rejected,
+        }
+
+
+def backoff(attempt: int, base: float, cap: float) -> float:
+    """
+    Exponential backoff with full jitter: a random delay of up to `base * 2 ** attempt` seconds, at most `cap`.
+    """
+
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """
+    Parse a Retry-After header, which is either a number of seconds or an HTTP date.
+
+    :return: The number of seconds to wait, or None if there's no usable header
+    """
+
+    if not value:
+        return None
+
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
@@ -0,0 +1,101 @@
+# coding=utf-8
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict
+
+from bot.constants import GUESS_POOL_CONCURRENCY, GUESS_POOL_SIZE
+
+log = logging.getLogger(__name__)
+
+
+class RoundPool:
+    """
+    Keeps a number of game rounds prepared ahead of time, so starting a round doesn't have to wait on Wikipedia.
+
+    Rounds are made by the given coroutine function, several at a time, whenever the pool isn't full.
+    If the pool is ever empty, a round is made on the spot instead.
+
+    Attributes
+    -----------
+    size: :class:`int`
+        How many rounds to keep ready.
+    concurrency: :class:`int`
+        How many rounds to prepare at the same time.
+    """
+
+    def __init__(self, make_round: Callable[[], Awaitable[Dict[str, Any]]], *,
+                 size: int = GUESS_POOL_SIZE, concurrency: int = GUESS_POOL_CONCURRENCY):
+        self.make_round = make_round
+        self.size = size
+        self.concurrency = concurrency
+
+        self.rounds = deque()
+        self._wanted = asyncio.Event()
+
+        self.served = 0
+        self.made_on_demand = 0
+        self.failures = 0
+        self.refill_times = deque(maxlen=100)
+
+    def __len__(self):
+        return len(self.rounds)
+
+    async def get(self) -> Dict[str, Any]:
+        """
+        Take a prepared round out of the pool, or make one now if there are none left.
+        """
+
+        self._wanted.set()
+
+        if self.rounds:
+            self.served += 1
+            return self.rounds.popleft()
+
+        log.debug("The round pool is empty, making a round on demand")
+        self.made_on_demand += 1
+        return await self.make_round()
+
+    async def run(self):
+        """
+        Keep the pool full - runs until cancelled.
+        """
+
+        while True:
+            missing = self.size - len(self.rounds)
+
+            if missing <= 0:
+                self._wanted.clear()
+                await self._wanted.wait()
+                continue
+
+            start = time.perf_counter()
+            jobs = [self.make_round() for _ in range(min(missing, self.concurrency))]
+            results = await asyncio.gather(*jobs, return_exceptions=True)
+            elapsed = time.perf_counter() - start
+
+            made = [result for result in results if not isinstance(result, Exception)]
+            self.failures += len(results) - len(made)
+            self.rounds.extend(made)
+
+            if made:
+                self.refill_times.append(elapsed)
+                log.trace("Prepared %d rounds in %.2fs", len(made), elapsed)
+            else:
+                log.warning("Failed to prepare any rounds: %r", results[0])
+                # Don't hammer Wikipedia while it's having trouble
+                await asyncio.sleep(30)
+
+    def stats(self) -> Dict[str, Any]:
+        average = sum(self.refill_times) / len(self.refill_times) if self.refill_times else 0
+        last = self.refill_times[-1] if self.refill_times else 0
+
+        return {
+            "depth": f"{len(self.rounds)}/{self.size}",
+            "served": self.served,
+            "made_on_demand": self.made_on_demand,
+            "failures": self.failures,
+            "refill_last_ms": round(last * 1000),
+            "refill_avg_ms": round(average * 1000),
+        }
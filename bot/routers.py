@@ -0,0 +1,284 @@
+# coding=utf-8
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Callable, Collection, Dict, List, Optional, Tuple
+
+from discord import Message, Reaction, User
+from discord.ext.commands import AutoShardedBot
+
+log = logging.getLogger(__name__)
+
+
+def average_us(times: Collection[float]) -> float:
+    return round(sum(times) / len(times) * 1_000_000, 1) if times else 0
+
+
+class Router:
+    """
+    Base for the routers, which listen for one kind of event and hand each one straight to whatever is waiting
+    on it. There's one of each kind per bot - use `of(bot)` to get it.
+    """
+
+    attribute = None  # Where the bot keeps this kind of router
+
+    @classmethod
+    def of(cls, bot: AutoShardedBot) -> Optional["Router"]:
+        """
+        Get the bot's router, starting it if there isn't one yet.
+
+        :return: The router, or None if the bot can't have one
+        """
+
+        router = getattr(bot, cls.attribute, None)
+
+        if router is None and hasattr(bot, "add_listener"):
+            log.debug("Starting the %s", cls.__name__)
+            router = cls(bot)
+            setattr(bot, cls.attribute, router)
+
+        return router
+
+
+class ReactionSession:
+    """
+    The reactions added to one message, as routed to it by a `ReactionRouter`.
+    """
+
+    def __init__(self, router: "ReactionRouter", message_id: int):
+        self.router = router
+        self.message_id = message_id
+        self.queue = asyncio.Queue()
+        self.ended = False
+
+    async def wait(self, check: Callable[[Reaction, User], bool], *, timeout: float) -> Tuple[Reaction, User]:
+        """
+        Wait for a reaction on the message that passes a check, like `bot.wait_for("reaction_add")` does.
+
+        :raises asyncio.TimeoutError: If no reaction passed the check in time, or the session was ended
+        """
+
+        deadline = time.monotonic() + timeout
+
+        while True:
+            item = await asyncio.wait_for(self.queue.get(), deadline - time.monotonic())
+
+            if item is None:
+                raise asyncio.TimeoutError()
+
+            reaction, user, routed_at = item
+            self.router.record_delivery(time.perf_counter() - routed_at)
+
+            if check(reaction, user):
+                return reaction, user
+
+    def end(self):
+        """
+        End the session early - whatever is waiting on it stops like it timed out.
+        """
+
+        self.ended = True
+        self.queue.put_nowait(None)
+
+
+class WaitForSession:
+    """
+    The reactions added to one message, as waited for with `bot.wait_for` when there's no `ReactionRouter`.
+
+    It can be waited on and ended early just like a `ReactionSession`.
+    """
+
+    def __init__(self, bot: AutoShardedBot):
+        self.bot = bot
+        self.waiting = None
+        self.ended = False
+
+    async def wait(self, check: Callable[[Reaction, User], bool], *, timeout: float) -> Tuple[Reaction, User]:
+        """
+        Wait for a reaction that passes a check.
+
+        :raises asyncio.TimeoutError: If no reaction passed the check in time, or the session was ended
+        """
+
+        if self.ended:
+            raise asyncio.TimeoutError()
+
+        self.waiting = asyncio.ensure_future(self.bot.wait_for("reaction_add", check=check, timeout=timeout))
+
+        try:
+            await asyncio.wait([self.waiting])
+        finally:
+            # If we're cancelled ourselves, stop listening too
+            self.waiting.cancel()
+
+        if self.waiting.cancelled():
+            raise asyncio.TimeoutError()
+        return self.waiting.result()
+
+    def end(self):
+        """
+        End the session early - whatever is waiting on it stops like it timed out.
+        """
+
+        self.ended = True
+
+        if self.waiting is not None:
+            self.waiting.cancel()
+
+
+class ReactionRouter(Router):
+    """
+    Routes reactions straight to whatever is waiting on the message they were added to.
+
+    Every `wait_for("reaction_add")` check runs on every reaction the bot sees, so with many paginators open,
+    every reaction costs a call for each of them. The router listens for reactions once, and looks up the
+    session for the reaction's message by its id instead.
+
+    There's one router per bot - use `ReactionRouter.of(bot)` to get it.
+    """
+
+    attribute = "reaction_router"
+
+    def __init__(self, bot: AutoShardedBot):
+        self.bot = bot
+        self.sessions = {}  # message id -> ReactionSession
+
+        self.routed = 0
+        self.unrouted = 0
+        self.dispatch_times = deque(maxlen=1000)
+        self.delivery_times = deque(maxlen=1000)
+
+        bot.add_listener(self.on_reaction_add)
+
+    def open(self, message_id: int) -> ReactionSession:
+        """
+        Start routing the reactions on a message to a new session - close it again when you're done.
+        """
+
+        session = self.sessions[message_id] = ReactionSession(self, message_id)
+        return session
+
+    def close(self, message_id: int):
+        self.sessions.pop(message_id, None)
+
+    async def on_reaction_add(self, reaction: Reaction, user: User):
+        start = time.perf_counter()
+        session = self.sessions.get(reaction.message.id)
+
+        if session is None:
+            self.unrouted += 1
+            return
+
+        session.queue.put_nowait((reaction, user, start))
+        self.routed += 1
+        self.dispatch_times.append(time.perf_counter() - start)
+
+    def record_delivery(self, seconds: float):
+        self.delivery_times.append(seconds)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "open_sessions": len(self.sessions),
+            "routed": self.routed,
+            "unrouted": self.unrouted,
+            "dispatch_us": average_us(self.dispatch_times),
+            "delivery_us": average_us(self.delivery_times),
+        }
+
+
+class ReplyPrompt:
+    """
+    A prompt waiting for one person's reply in one channel, as routed to it by a `ReplyRouter`.
+
+    `future` gets the first reply that passes `check`, or is cancelled when the prompt is closed.
+    """
+
+    def __init__(self, key: Tuple[int, int], check: Callable[[str], bool]):
+        self.key = key
+        self.check = check
+        self.future = asyncio.get_event_loop().create_future()
+
+
+class ReplyRouter(Router):
+    """
+    Routes messages straight to the prompts waiting for a reply from their author, in their channel.
+
+    With `wait_for("message")`, every open prompt's check runs on every message the bot sees, in every channel.
+    The router listens for messages once, and looks up the prompts for the message's channel and author instead,
+    so how many prompts are open doesn't matter to everyone else chatting.
+
+    There's one router per bot - use `ReplyRouter.of(bot)` to get it.
+    """
+
+    attribute = "reply_router"
+
+    def __init__(self, bot: AutoShardedBot):
+        self.bot = bot
+        self.prompts = {}  # (channel id, author id) -> [ReplyPrompt]
+
+        self.routed = 0
+        self.rejected = 0
+        self.unrouted = 0
+        self.dispatch_times = deque(maxlen=1000)
+
+        bot.add_listener(self.on_message)
+
+    def open(self, channel_id: int, author_id: int, check: Callable[[str], bool] = str.isdigit) -> ReplyPrompt:
+        """
+        Start waiting for someone's reply in a channel - close the prompt again when you're done.
+
+        :param channel_id: The channel to wait for a reply in
+        :param author_id: Who to wait for a reply from
+        :param check: Whether a message's content counts as a reply - only digits, by default
+        """
+
+        key = (channel_id, author_id)
+        prompt = ReplyPrompt(key, check)
+        self.prompts.setdefault(key, []).append(prompt)
+
+        return prompt
+
+    def close(self, prompt: ReplyPrompt):
+        """
+        Stop routing replies to a prompt, cancelling its future if nothing was delivered to it.
+        """
+
+        prompts: List[ReplyPrompt] = self.prompts.get(prompt.key, [])
+
+        if prompt in prompts:
+            prompts.remove(prompt)
+        if not prompts:
+            self.prompts.pop(prompt.key, None)
+
+        prompt.future.cancel()
+
+    async def on_message(self, message: Message):
+        start = time.perf_counter()
+        prompts = self.prompts.get((message.channel.id, message.author.id))
+
+        if prompts is None:
+            self.unrouted += 1
+            return
+
+        # Like with wait_for, every prompt waiting on this person here gets the reply
+        for prompt in prompts:
+            if prompt.future.done():
+                continue
+
+            if prompt.check(message.content):
+                prompt.future.set_result(message)
+                self.routed += 1
+            else:
+                self.rejected += 1
+
+        self.dispatch_times.append(time.perf_counter() - start)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "open_prompts": sum(map(len, self.prompts.values())),
+            "routed": self.routed,
+            "rejected": self.rejected,
+            "unrouted": self.unrouted,
+            "dispatch_us": average_us(self.dispatch_times),
+        }
@@ -0,0 +1,170 @@
+# coding=utf-8
+import logging
+import time
+from collections import Counter, OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+from bot.cache import estimate_size
+from bot.constants import SESSIONS_MAX, SESSIONS_MAX_PER_GUILD
+
+log = logging.getLogger(__name__)
+
+
+class Session:
+    """
+    An interactive session, like a paginator or a prompt, as tracked by a `SessionRegistry`.
+
+    Attributes
+    -----------
+    kind: :class:`str`
+        What sort of session this is, e.g. "paginator".
+    guild_id: Optional[:class:`int`]
+        The guild the session is in, or None in DMs.
+    end: Callable[[], None]
+        Ends the session early, so whatever runs it can clean up after itself.
+    contents: Callable[[], Any]
+        Returns what the session holds on to, to estimate how much memory it takes up.
+    used_at: :class:`float`
+        When the session was last used.
+    """
+
+    __slots__ = ("registry", "kind", "guild_id", "end", "contents", "opened_at", "used_at")
+
+    def __init__(self, registry: "SessionRegistry", kind: str, guild_id: Optional[int],
+                 end: Callable[[], None], contents: Callable[[], Any]):
+        self.registry = registry
+        self.kind = kind
+        self.guild_id = guild_id
+        self.end = end
+        self.contents = contents
+
+        self.opened_at = self.used_at = time.monotonic()
+
+    def touch(self):
+        """
+        Mark the session as used, so it's the last to be ended to make room.
+        """
+
+        self.registry.touch(self)
+
+    def size(self) -> int:
+        """
+        Roughly estimate how many bytes the session holds on to.
+        """
+
+        return estimate_size(self.contents())
+
+
+class SessionRegistry:
+    """
+    Keeps track of the interactive sessions open across the bot, and caps how many there are.
+
+    Paginators and prompts hold on to their pages and futures for minutes, or even hours, after anyone
+    last looked at them. When opening another would go over the limit for the whole bot, or for its guild,
+    the least recently used session is ended first - which clears its reactions or cancels its prompt, like
+    timing out would - so the memory they take up stays flat no matter how busy it gets.
+
+    Attributes
+    -----------
+    max_sessions: :class:`int`
+        The most sessions open at once.
+    max_per_guild: :class:`int`
+        The most sessions open at once in one guild.
+    """
+
+    def __init__(self, max_sessions: int = SESSIONS_MAX, max_per_guild: int = SESSIONS_MAX_PER_GUILD):
+        self.max_sessions = max_sessions
+        self.max_per_guild = max_per_guild
+
+        self.sessions = OrderedDict()  # Session -> None, least recently used first
+        self.guilds = {}  # guild id -> OrderedDict of its sessions, least recently used first
+
+        self.opened = Counter()
+        self.evicted = Counter()
+
+    def __len__(self):
+        return len(self.sessions)
+
+    def open(self, kind: str, guild_id: Optional[int], end: Callable[[], None],
+             contents: Callable[[], Any] = lambda: None) -> Session:
+        """
+        Start tracking a session, ending the least recently used ones if there are too many - close it when it's done.
+
+        :param kind: What sort of session this is, e.g. "paginator"
+        :param guild_id: The guild the session is in, or None in DMs, which only count towards the global limit
+        :param end: Ends the session early
+        :param contents: Returns what the session holds on to, to estimate its memory use
+        """
+
+        if guild_id is not None:
+            while len(self.guilds.get(guild_id, ())) >= self.max_per_guild:
+                self.evict(next(iter(self.guilds[guild_id])), "guild")
+
+        while len(self.sessions) >= self.max_sessions:
+            self.evict(next(iter(self.sessions)), "global")
+
+        session = Session(self, kind, guild_id, end, contents)
+        self.sessions[session] = None
+
+        if guild_id is not None:
+            self.guilds.setdefault(guild_id, OrderedDict())[session] = None
+
+        self.opened[kind] += 1
+        return session
+
+    def touch(self, session: Session):
+        session.used_at = time.monotonic()
+
+        if session in self.sessions:
+            self.sessions.move_to_end(session)
+
+            if session.guild_id is not None:
+                self.guilds[session.guild_id].move_to_end(session)
+
+    def close(self, session: Session):
+        """
+        Stop tracking a session - it's fine to close one that was already evicted.
+        """
+
+        if session not in self.sessions:
+            return
+
+        del self.sessions[session]
+
+        if session.guild_id is not None:
+            guild = self.guilds[session.guild_id]
+            del guild[session]
+
+            if not guild:
+                del self.guilds[session.guild_id]
+
+    def evict(self, session: Session, limit: str):
+        log.debug("Ending a %s session to stay within the %s limit", session.kind, limit)
+
+        self.close(session)
+        self.evicted[limit] += 1
+
+        try:
+            session.end()
+        except Exception:
+            log.exception("Failed to end an evicted %s session", session.kind)
+
+    def stats(self) -> Dict[str, Any]:
+        sizes = [session.size() for session in self.sessions]
+        now = time.monotonic()
+
+        return {
+            "open": len(self.sessions),
+            "by_kind": dict(Counter(session.kind for session in self.sessions)),
+            "guilds": len(self.guilds),
+            "busiest_guild": max(map(len, self.guilds.values()), default=0),
+            "opened": sum(self.opened.values()),
+            "evicted": dict(self.evicted),
+            "estimated_kb": round(sum(sizes) / 1024, 1),
+            "largest_kb": round(max(sizes, default=0) / 1024, 1),
+            "oldest_idle_s": round(now - next(iter(self.sessions)).used_at) if self.sessions else 0,
+        }
+
+
+# Shared by every paginator and prompt, so the limits apply to all of them together
+sessions = SessionRegistry()
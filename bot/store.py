@@ -0,0 +1,281 @@
+# coding=utf-8
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import time
+from typing import Any, Dict, Iterable, Optional, Sequence
+
+from bot.constants import SNAKE_STORE_PATH, SNAKE_STORE_PREFETCH_CONCURRENCY
+from bot.wiki import UPSTREAM_ERRORS, WikiClient, normalize_query, parse_sections
+
+log = logging.getLogger(__name__)
+
+# Relative store paths are relative to the project, like snakes.json, not to wherever the bot was started from
+PROJECT_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS pages (
+    pageid INTEGER PRIMARY KEY,
+    title TEXT NOT NULL,
+    revision INTEGER,
+    fullurl TEXT NOT NULL,
+    extract TEXT NOT NULL,
+    brief TEXT,
+    sections TEXT NOT NULL,
+    images TEXT NOT NULL,
+    fetched_at REAL NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS names (
+    name TEXT PRIMARY KEY,
+    pageid INTEGER NOT NULL REFERENCES pages (pageid)
+);
+"""
+
+PICKS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS picks (
+    scope TEXT NOT NULL,
+    query TEXT NOT NULL,
+    choice TEXT NOT NULL,
+    picked_at REAL NOT NULL,
+    PRIMARY KEY (scope, query)
+);
+"""
+
+
+def resolve_path(path: str) -> str:
+    return path if path == ":memory:" else os.path.join(PROJECT_PATH, path)
+
+
+class SnakeStore:
+    """
+    A local SQLite copy of the Wikipedia pages for our snakes.
+
+    Pages are stored with their extract, parsed sections, images, URL and revision, and can be looked up
+    by any name they were stored under, so the bot can answer without going online.
+    """
+
+    def __init__(self, path: str = SNAKE_STORE_PATH):
+        self.path = resolve_path(path)
+        self.db = sqlite3.connect(self.path)
+        self.db.row_factory = sqlite3.Row
+        self.db.executescript(SCHEMA)
+
+        self.hits = 0
+        self.misses = 0
+
+    def __contains__(self, name: str):
+        query = "SELECT 1 FROM names WHERE name = ?"
+        return self.db.execute(query, (normalize_query(name),)).fetchone() is not None
+
+    def __len__(self):
+        return self.db.execute("SELECT COUNT(*) FROM pages").fetchone()[0]
+
+    def get(self, name: str) -> Optional[Dict[str, Any]]:
+        """
+        Get a stored page by one of its names.
+
+        :param name: An article title or any other name the page was stored under
+        :return: The page, in the same format as `WikiClient.parse_page` plus its sections, or None
+        """
+
+        row = self.db.execute(
+            "SELECT pages.* FROM names JOIN pages USING (pageid) WHERE names.name = ?",
+            (normalize_query(name),)
+        ).fetchone()
+
+        if row is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+
+        return {
+            "title": row["title"],
+            "extract": row["extract"],
+            "images": json.loads(row["images"]),
+            "fullurl": row["fullurl"],
+            "pageid": row["pageid"],
+            "revision": row["revision"],
+            "brief": row["brief"],
+            "sections": [tuple(section) for section in json.loads(row["sections"])],
+        }
+
+    def put(self, page: Dict[str, Any], names: Iterable[str] = ()):
+        """
+        Store a page, replacing any older revision of it.
+
+        :param page: A page from `WikiClient`
+        :param names: Names to store the page under, on top of its title
+        """
+
+        brief, sections = parse_sections(page["extract"])
+
+        with self.db:
+            self.db.execute(
+                "INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    page["pageid"], page["title"], page.get("revision"), page["fullurl"], page["extract"],
+                    brief, json.dumps(sections), json.dumps(page["images"]), time.time()
+                )
+            )
+            self.db.executemany(
+                "INSERT OR REPLACE INTO names VALUES (?, ?)",
+                ((normalize_query(name), page["pageid"]) for name in {page["title"], *names})
+            )
+
+    def revisions(self) -> Dict[int, Optional[int]]:
+        """
+        Map every stored pageid to the revision we have of it.
+        """
+
+        return dict(self.db.execute("SELECT pageid, revision FROM pages").fetchall())
+
+    def close(self):
+        self.db.close()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "pages": len(self),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+class PickStore:
+    """
+    Remembers which snake people picked when a name was ambiguous, so they don't have to pick it again.
+
+    Picks are stored per scope - a user or a guild - and looking one up tries the given scopes in order,
+    so a user's own pick wins over whatever was last picked in their guild.
+    """
+
+    def __init__(self, path: str = SNAKE_STORE_PATH):
+        self.path = resolve_path(path)
+        self.db = sqlite3.connect(self.path)
+        self.db.executescript(PICKS_SCHEMA)
+
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return self.db.execute("SELECT COUNT(*) FROM picks").fetchone()[0]
+
+    def get(self, query: str, scopes: Sequence[str]) -> Optional[str]:
+        """
+        Get the choice picked for a query in the first scope that has one.
+
+        :param query: The normalized query
+        :param scopes: One or two scopes to look in, in order of preference
+        :return: The picked choice, or None
+        """
+
+        # The statement always takes two scopes, so one scope - like a user's in DMs - is looked up twice
+        first, second = (*scopes, *scopes)[:2]
+
+        rows = dict(self.db.execute(
+            "SELECT scope, choice FROM picks WHERE query = ? AND scope IN (?, ?)", (query, first, second)
+        ).fetchall())
+
+        choice = next((rows[scope] for scope in scopes if scope in rows), None)
+
+        if choice is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return choice
+
+    def put(self, query: str, choice: str, scopes: Iterable[str]):
+        """
+        Remember a pick for a query in every given scope.
+        """
+
+        with self.db:
+            self.db.executemany(
+                "INSERT OR REPLACE INTO picks VALUES (?, ?, ?, ?)",
+                ((scope, query, choice, time.time()) for scope in scopes)
+            )
+
+    def close(self):
+        self.db.close()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        hit_rate = self.hits / lookups if lookups else 0
+
+        return {
+            "picks": len(self),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": f"{hit_rate:.1%}",
+        }
+
+
+async def prefetch(store: SnakeStore, wiki: WikiClient, *, titles: Iterable[str] = (), pageids: Iterable[int] = (),
+                   concurrency: int = SNAKE_STORE_PREFETCH_CONCURRENCY) -> int:
+    """
+    Fetch pages from Wikipedia and put them in the store, a few at a time.
+
+    Every page needs a request of its own for its extract anyway, so they are fetched one by one,
+    with at most `concurrency` requests in flight so we don't flood Wikipedia.
+
+    :param store: The store to fill
+    :param wiki: The client to fetch pages with
+    :param titles: Article titles to fetch - each is stored under its title
+    :param pageids: Pages to fetch again, under the names they were already stored under
+    :param concurrency: The most requests to have in flight at once
+    :return: The number of pages that were stored
+    """
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def fetch_one(**kwargs):
+        async with semaphore:
+            try:
+                pages = await wiki.pages(**kwargs)
+            except UPSTREAM_ERRORS:
+                log.warning("Failed to prefetch %s", kwargs, exc_info=True)
+                return False
+
+        (name, page), = pages.items()
+        if page is None:
+            log.debug("Nothing found to prefetch for %r", name)
+            return False
+
+        store.put(page, names=[name] if isinstance(name, str) else [])
+        return True
+
+    jobs = [fetch_one(titles=[title]) for title in titles]
+    jobs += [fetch_one(pageids=[pageid]) for pageid in pageids]
+
+    stored = await asyncio.gather(*jobs)
+    log.debug("Prefetched %d of %d pages", sum(stored), len(jobs))
+    return sum(stored)
+
+
+async def refresh(store: SnakeStore, wiki: WikiClient, titles: Iterable[str], *,
+                  concurrency: int = SNAKE_STORE_PREFETCH_CONCURRENCY) -> int:
+    """
+    Bring the store up to date: fetch pages that have a newer revision online, and any titles that are missing.
+
+    :param store: The store to refresh
+    :param wiki: The client to fetch pages with
+    :param titles: Every article title that should be in the store
+    :param concurrency: The most requests to have in flight at once
+    :return: The number of pages that were stored
+    """
+
+    stored = store.revisions()
+    current = await wiki.revisions(stored)
+    stale = [pageid for pageid, revision in stored.items() if current.get(pageid, revision) != revision]
+
+    # Make sure we fetch the new revision, not the one we have cached
+    for pageid in stale:
+        wiki.page_cache.pop(pageid)
+
+    missing = [title for title in titles if title not in store]
+    log.info("Refreshing the snake store: %d pages are out of date, %d are missing", len(stale), len(missing))
+
+    return await prefetch(store, wiki, titles=missing, pageids=stale, concurrency=concurrency)
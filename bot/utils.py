@@ -1,11 +1,14 @@
 # coding=utf-8
 import asyncio
-from typing import List
+from functools import partial
+from typing import Any, Awaitable, Callable, Dict, Hashable, List
 
 import discord
 from discord.ext.commands import BadArgument, Context
 
 from bot.pagination import LinePaginator
+from bot.routers import ReplyRouter
+from bot.sessions import sessions
 
 
 async def disambiguate(ctx: Context, entries: List[str],
@@ -29,42 +32,61 @@ async def disambiguate(ctx: Context, entries: List[str],
 
     choices = (f'{index}: {entry}' for index, entry in enumerate(entries, start=1))
 
-    def check(message):
-        return (message.content.isdigit() and
-                message.author == ctx.author and
-                message.channel == ctx.channel)
+    if embed is None:
+        embed = discord.Embed()
+
+    # Have the author's numeric replies in this channel routed straight to us, if the bot can - otherwise use wait_for
+    router = ReplyRouter.of(ctx.bot)
+
+    if router is not None:
+        prompt = router.open(ctx.channel.id, ctx.author.id)
+        reply = prompt.future
+    else:
+        def check(message):
+            return (message.content.isdigit() and
+                    message.author == ctx.author and
+                    message.channel == ctx.channel)
+
+        prompt = None
+        reply = asyncio.ensure_future(ctx.bot.wait_for('message', check=check))
+
+    pagination = asyncio.ensure_future(LinePaginator.paginate(choices, ctx, embed=embed, max_lines=per_page,
+                                                              empty=empty, max_size=6000, timeout=9000,
+                                                              track_session=False))
+
+    # Count towards the limits on open sessions, along with the paginator - if we're evicted to make room,
+    # the prompt is cancelled, and the paginator with it
+    guild_id = ctx.guild.id if ctx.guild is not None else None
+    tracked = sessions.open("prompt", guild_id, end=reply.cancel, contents=lambda: entries)
+
+    loop = asyncio.get_event_loop()
+    deadline = loop.time() + timeout
+    pending = {reply, pagination}
 
     try:
-        if embed is None:
-            embed = discord.Embed()
+        while reply in pending:
+            done, pending = await asyncio.wait(pending, timeout=max(deadline - loop.time(), 0),
+                                               return_when=asyncio.FIRST_COMPLETED)
 
-        coro1 = ctx.bot.wait_for('message', check=check, timeout=timeout)
-        coro2 = LinePaginator.paginate(choices, ctx, embed=embed, max_lines=per_page,
-                                       empty=empty, max_size=6000, timeout=9000)
+            if not done:
+                raise BadArgument('Timed out.')
 
-        # wait_for timeout will go to except instead of the wait_for thing as I expected
-        futures = [asyncio.ensure_future(coro1), asyncio.ensure_future(coro2)]
-        done, pending = await asyncio.wait(futures, return_when=asyncio.FIRST_COMPLETED, loop=ctx.bot.loop)
+            # Pagination was canceled - result is None. If there was only one page, it returns the message it sent
+            # straight away, and we keep waiting for the reply.
+            if pagination in done and reply not in done and pagination.result() is None:
+                raise BadArgument('Canceled.')
 
-        # :yert:
-        result = list(done)[0].result()
+        if reply.cancelled():
+            raise BadArgument('Closed to make room for newer prompts.')
 
-        # Pagination was canceled - result is None
-        if result is None:
-            for coro in pending:
-                coro.cancel()
-            raise BadArgument('Canceled.')
+        result = reply.result()
+    finally:
+        sessions.close(tracked)
 
-        # Pagination was not initiated, only one page
-        if result.author == ctx.bot.user:
-            # Continue the wait_for
-            result = await list(pending)[0]
+        if prompt is not None:
+            router.close(prompt)
 
-        # Love that duplicate code
-        for coro in pending:
-            coro.cancel()
-    except asyncio.TimeoutError:
-        raise BadArgument('Timed out.')
+        await cancel_all(reply, pagination)
 
     # Guaranteed to not error because of isdigit() in check
     index = int(result.content)
@@ -75,6 +97,17 @@ async def disambiguate(ctx: Context, entries: List[str],
         raise BadArgument('Invalid choice.')
 
 
+async def cancel_all(*futures: asyncio.Future):
+    """
+    Cancel futures and wait until they've finished, so none are left running - or with an exception nobody retrieved.
+    """
+
+    for future in futures:
+        future.cancel()
+
+    await asyncio.gather(*futures, return_exceptions=True)
+
+
 class CaseInsensitiveDict(dict):
     """
     We found this class on StackOverflow. Thanks to m000 for writing it!
@@ -119,3 +152,75 @@ class CaseInsensitiveDict(dict):
         for k in list(self.keys()):
             v = super(CaseInsensitiveDict, self).pop(k)
             self.__setitem__(k, v)
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls that would do the same work.
+
+    While a call for a key is in flight, anyone else asking for the same key waits on that call
+    instead of starting their own, and everyone gets the same result or exception. A caller being
+    cancelled doesn't cancel the call for the others - only when every caller has given up is
+    the call itself cancelled.
+    """
+
+    def __init__(self):
+        self._calls = {}  # key -> task
+        self._waiters = {}  # key -> number of callers waiting on the task
+
+        self.started = 0
+        self.coalesced = 0
+
+    def __len__(self):
+        return len(self._calls)
+
+    async def run(self, key: Hashable, factory: Callable[[], Awaitable]) -> Any:
+        """
+        Get the result of the call for a key, starting it if nobody else has.
+
+        :param key: What identifies the work - calls with equal keys are coalesced
+        :param factory: Creates the coroutine doing the work, only called if there isn't one in flight
+        :return: The result of the call
+        """
+
+        task = self._calls.get(key)
+
+        if task is None:
+            self.started += 1
+            task = asyncio.ensure_future(factory())
+            task.add_done_callback(partial(self._done, key))
+            self._calls[key] = task
+            self._waiters[key] = 0
+        else:
+            self.coalesced += 1
+
+        self._waiters[key] += 1
+
+        try:
+            return await asyncio.shield(task)
+        finally:
+            if self._calls.get(key) is task:
+                self._waiters[key] -= 1
+
+                if self._waiters[key] == 0 and not task.done():
+                    # Everyone waiting was cancelled, so nobody wants the result any more - and whoever
+                    # asks next mustn't join the cancelled call before its done callback has run
+                    del self._calls[key]
+                    del self._waiters[key]
+                    task.cancel()
+
+    def _done(self, key: Hashable, task: asyncio.Future):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+            del self._waiters[key]
+
+        # Make sure an exception nobody waited for isn't reported as never retrieved
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "in_flight": len(self._calls),
+            "started": self.started,
+            "coalesced": self.coalesced,
+        }
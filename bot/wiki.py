@@ -0,0 +1,601 @@
+# coding=utf-8
+import asyncio
+import logging
+import re
+from functools import partial
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+import aiohttp
+import async_timeout
+from aiohttp import ClientSession
+
+from bot.cache import MISSING, TTLCache
+from bot.constants import (
+    WIKI_BACKOFF_BASE, WIKI_BACKOFF_MAX, WIKI_BATCH_LIMIT, WIKI_BREAKER_RESET, WIKI_BREAKER_THRESHOLD,
+    WIKI_IMAGE_CACHE_SIZE, WIKI_IMAGE_CACHE_TTL, WIKI_NEGATIVE_CACHE_TTL, WIKI_PAGE_CACHE_BYTES, WIKI_PAGE_CACHE_SIZE,
+    WIKI_PAGE_CACHE_TTL, WIKI_RATE_BURST, WIKI_RATE_LIMIT, WIKI_REQUEST_TIMEOUT, WIKI_RETRIES, WIKI_RETRY_AFTER_MAX,
+    WIKI_SEARCH_CACHE_SIZE, WIKI_SEARCH_CACHE_TTL, WIKI_THUMBNAIL_WIDTH
+)
+from bot.resilience import CircuitBreaker, CircuitOpenError, TokenBucket, backoff, parse_retry_after
+from bot.utils import SingleFlight
+
+log = logging.getLogger(__name__)
+
+API_URL = "https://en.wikipedia.org/w/api.php"
+
+# Wikipedia error page ID(?) - what we show when a search finds nothing
+FALLBACK_PAGEID = 41118
+
+# Everything we need to build a page, on top of whatever selects the pages
+PAGE_PARAMS = {
+    'prop': 'extracts|images|info',
+    'explaintext': '',
+    'inprop': 'url',
+    'imlimit': 'max',
+    'exlimit': 'max',
+}
+
+# Everything that can go wrong when asking Wikipedia for something
+UPSTREAM_ERRORS = (asyncio.TimeoutError, aiohttp.ClientError, CircuitOpenError)
+
+# Continuations of the page properties we ask for, as opposed to a generator's
+PROP_CONTINUATIONS = ('excontinue', 'imcontinue', 'iicontinue')
+
+# A `== Heading ==` line in a plaintext extract
+HEADING_RE = re.compile(r'^(=+) (.+?) \1$', flags=re.MULTILINE)
+
+
+def normalize_query(query: str) -> str:
+    """
+    Normalise a search string so that trivially different spellings share a cache entry.
+    """
+
+    return " ".join(query.casefold().split())
+
+
+def parse_brief(extract: str) -> Optional[str]:
+    """
+    Get the introduction of a plaintext extract - everything before the first heading.
+
+    :return: The introduction, or None if the page has no headings
+    """
+
+    match = HEADING_RE.search(extract)
+    return extract[:match.start()] if match else None
+
+
+def iter_sections(extract: str) -> Iterator[Tuple[str, str]]:
+    """
+    Lazily go through the `== Heading ==` sections of a plaintext extract, in a single pass.
+
+    Only the first paragraph of each section is used as its body. Nothing past the last section
+    you ask for is looked at, so stop iterating as soon as you have enough.
+
+    :param extract: The plaintext extract of a page
+    :return: An iterator of (heading, body) tuples
+    """
+
+    for match in HEADING_RE.finditer(extract):
+        end = extract.find("\n\n", match.end())
+        yield match.group(2), extract[match.end():end if end != -1 else None]
+
+
+def parse_sections(extract: str) -> Tuple[Optional[str], List[Tuple[str, str]]]:
+    """
+    Split a plaintext extract into its introduction and all of its sections.
+
+    :param extract: The plaintext extract of a page
+    :return: The introduction (None if the page has no headings) and a list of (heading, body) tuples
+    """
+
+    return parse_brief(extract), list(iter_sections(extract))
+
+
+class WikiClient:
+    """
+    Talks to the MediaWiki API, caching search results and pages.
+
+    Searches are cached as normalised search string -> pageid, and pages as pageid -> parsed page,
+    so a warm cache answers most lookups without going online at all. Lookups for the same search
+    or page that are already in flight are shared instead of being requested again.
+
+    Requests are rate limited, and retried with backoff when Wikipedia is struggling. If it keeps failing,
+    a circuit breaker stops asking it for a while, and expired cache entries are served instead where we have them.
+    """
+
+    def __init__(self, session: ClientSession, *, api_url: str = API_URL):
+        self.session = session
+        self.api_url = api_url
+        self.requests = 0
+        self.retries = 0
+        self.stale_served = 0
+        self.inflight = SingleFlight()
+
+        self.limiter = TokenBucket(WIKI_RATE_LIMIT, WIKI_RATE_BURST)
+        self.breaker = CircuitBreaker(WIKI_BREAKER_THRESHOLD, WIKI_BREAKER_RESET)
+
+        self.search_cache = TTLCache(
+            max_entries=WIKI_SEARCH_CACHE_SIZE,
+            ttl=WIKI_SEARCH_CACHE_TTL,
+            negative_ttl=WIKI_NEGATIVE_CACHE_TTL,
+            keep_stale=True
+        )
+        self.page_cache = TTLCache(
+            max_entries=WIKI_PAGE_CACHE_SIZE,
+            max_bytes=WIKI_PAGE_CACHE_BYTES,
+            ttl=WIKI_PAGE_CACHE_TTL,
+            negative_ttl=WIKI_NEGATIVE_CACHE_TTL,
+            keep_stale=True
+        )
+        self.title_cache = TTLCache(
+            max_entries=WIKI_SEARCH_CACHE_SIZE,
+            ttl=WIKI_PAGE_CACHE_TTL,
+            negative_ttl=WIKI_NEGATIVE_CACHE_TTL
+        )
+        self.image_cache = TTLCache(
+            max_entries=WIKI_IMAGE_CACHE_SIZE,
+            ttl=WIKI_IMAGE_CACHE_TTL,
+            negative_ttl=WIKI_NEGATIVE_CACHE_TTL
+        )
+
+    async def fetch(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Make an `action=query` request to the API.
+
+        The request waits its turn with the rate limiter, and is retried with jittered exponential backoff
+        if it times out, can't connect, or gets a 429 or 5xx response - honouring any Retry-After we're given.
+
+        :param params: Query parameters, on top of the ones every request uses
+        :return: The decoded JSON response
+        :raises CircuitOpenError: Wikipedia has been failing, so we're not asking it right now
+        :raises asyncio.TimeoutError, aiohttp.ClientError: The request failed, even after retrying
+        """
+
+        params = {
+            'format': 'json',
+            'action': 'query',
+            'utf8': '',
+            **params
+        }
+
+        attempt = 0
+
+        while True:
+            if not self.breaker.allow():
+                raise CircuitOpenError("Wikipedia is unavailable, not asking it again yet")
+
+            await self.limiter.acquire()
+            self.requests += 1
+            retry_after = None
+            retryable = True
+
+            try:
+                async with async_timeout.timeout(WIKI_REQUEST_TIMEOUT):
+                    async with self.session.get(self.api_url, params=params) as response:
+                        if response.status == 429 or response.status >= 500:
+                            retry_after = parse_retry_after(response.headers.get("Retry-After"))
+                        elif response.status >= 400:
+                            # Our fault, not Wikipedia's - asking again won't help
+                            retryable = False
+
+                        response.raise_for_status()
+
+                        try:
+                            json = await response.json()
+                        except ValueError as error:
+                            # Like an error page from a proxy in front of Wikipedia
+                            raise aiohttp.ClientError(f"Wikipedia sent a body that isn't JSON: {error}") from error
+            except (asyncio.TimeoutError, aiohttp.ClientError) as error:
+                if not retryable:
+                    self.breaker.success()
+                    raise
+
+                self.breaker.failure()
+
+                if attempt >= WIKI_RETRIES or self.breaker.state == CircuitBreaker.OPEN:
+                    raise
+                if retry_after is not None and retry_after > WIKI_RETRY_AFTER_MAX:
+                    log.warning("Wikipedia asked us to retry after %.0fs, giving up instead", retry_after)
+                    raise
+
+                delay = max(retry_after or 0, backoff(attempt, WIKI_BACKOFF_BASE, WIKI_BACKOFF_MAX))
+                log.debug("Request to Wikipedia failed with %r, retrying in %.2fs", error, delay)
+
+                attempt += 1
+                self.retries += 1
+                await asyncio.sleep(delay)
+                continue
+            except asyncio.CancelledError:
+                # Nobody wants the answer any more, which says nothing about Wikipedia
+                self.breaker.release()
+                raise
+            except BaseException:
+                # A half-open breaker would wait on this trial forever
+                self.breaker.failure()
+                raise
+
+            self.breaker.success()
+            return json
+
+    async def lookup(self, query: str) -> Optional[Dict[str, Any]]:
+        """
+        Search for a page and get it, in a single round trip.
+
+        This uses the search as a generator for the page query, so the search result and the page data
+        come back in the same response instead of needing a request each.
+
+        :param query: What to search for
+        :return: The parsed page of the first result, or None if there were no results
+        """
+
+        key = normalize_query(query)
+        pageid = self.search_cache.get(key)
+
+        if pageid is not MISSING:
+            log.trace("Search cache hit for '%s'", key)
+            return await self.page(pageid) if pageid is not None else None
+
+        try:
+            return await self.inflight.run(("search", key), partial(self._lookup, query, key))
+        except UPSTREAM_ERRORS:
+            pageid = self.search_cache.stale(key)
+            page = self.page_cache.stale(pageid) if pageid not in (MISSING, None) else pageid
+
+            if page is MISSING:
+                raise
+
+            log.info("Wikipedia is unavailable, serving a stale result for '%s'", key)
+            self.stale_served += 1
+            return page
+
+    async def _lookup(self, query: str, key: str) -> Optional[Dict[str, Any]]:
+        params = {
+            'generator': 'search',
+            'gsrsearch': query,
+            'gsrlimit': '1',
+            **PAGE_PARAMS
+        }
+
+        # Only follow the continuations for this result's images, not the search's continuation to the next result
+        pages, _ = await self._query_all(params, follow_generator=False)
+
+        try:
+            page = self.parse_page(next(iter(pages.values())))
+        except (StopIteration, KeyError):
+            log.debug("No search results for '%s'", key)
+            self.search_cache.set(key, None)
+            return None
+
+        if page["extract"] is None:
+            # It was the only page in the response, so it really doesn't have any text
+            page["extract"] = ""
+
+        self.search_cache.set(key, page["pageid"])
+        self.page_cache.set(page["pageid"], page)
+        return page
+
+    async def page(self, pageid: int) -> Optional[Dict[str, Any]]:
+        """
+        Get a page's title, plaintext extract, image titles and URL.
+
+        :param pageid: The page to get
+        :return: The parsed page, or None if the page could not be found
+        """
+
+        page = self.page_cache.get(pageid)
+
+        if page is not MISSING:
+            log.trace("Page cache hit for %s", pageid)
+            return page
+
+        try:
+            return await self.inflight.run(("page", pageid), partial(self._page, pageid))
+        except UPSTREAM_ERRORS:
+            page = self.page_cache.stale(pageid)
+
+            if page is MISSING:
+                raise
+
+            log.info("Wikipedia is unavailable, serving a stale page for %s", pageid)
+            self.stale_served += 1
+            return page
+
+    async def _page(self, pageid: int) -> Optional[Dict[str, Any]]:
+        params = {
+            'pageids': pageid,
+            **PAGE_PARAMS
+        }
+
+        pages, _ = await self._query_all(params)
+
+        try:
+            page = self.parse_page(pages[f"{pageid}"])
+        except KeyError:
+            log.debug("Page %s is missing from the response", pageid)
+            page = None
+
+        if page is not None and page["extract"] is None:
+            # It was the only page we asked for, so it really doesn't have any text
+            page["extract"] = ""
+
+        self.page_cache.set(pageid, page)
+        return page
+
+    async def pages(self, *, titles: Iterable[str] = (), pageids: Iterable[int] = (),
+                    extracts: bool = True) -> Dict[Union[str, int], Optional[Dict[str, Any]]]:
+        """
+        Get many pages at once, using as few requests as the API allows.
+
+        Pages are requested up to `WIKI_BATCH_LIMIT` titles or pageids at a time, and redirects are followed.
+        The API only returns so many full extracts per response, so when `extracts` is set a batch
+        follows continuations, and asks again for any page still without its extract - if you don't need
+        the text, leave it out and the whole batch is a single request.
+
+        :param titles: Article titles to get
+        :param pageids: Pageids to get
+        :param extracts: Whether the pages need their plaintext extract - pages without one are not cached
+        :return: A dict mapping every given title and pageid to its parsed page, or None if it doesn't exist
+        """
+
+        result = {}
+        missing_titles = []
+        missing_pageids = []
+
+        for title in titles:
+            pageid = self.title_cache.get(normalize_query(title))
+            page = self.page_cache.get(pageid) if pageid not in (MISSING, None) else MISSING
+
+            if pageid is None or page is not MISSING:
+                result[title] = page if pageid is not None else None
+            else:
+                missing_titles.append(title)
+
+        for pageid in pageids:
+            page = self.page_cache.get(pageid)
+
+            if page is not MISSING:
+                result[pageid] = page
+            else:
+                missing_pageids.append(pageid)
+
+        for start in range(0, len(missing_titles), WIKI_BATCH_LIMIT):
+            chunk = missing_titles[start:start + WIKI_BATCH_LIMIT]
+            result.update(await self._fetch_batch('titles', chunk, extracts))
+
+        for start in range(0, len(missing_pageids), WIKI_BATCH_LIMIT):
+            chunk = missing_pageids[start:start + WIKI_BATCH_LIMIT]
+            result.update(await self._fetch_batch('pageids', chunk, extracts))
+
+        return result
+
+    async def _fetch_batch(self, kind: str, chunk: List[Union[str, int]],
+                           extracts: bool) -> Dict[Union[str, int], Optional[Dict[str, Any]]]:
+        """
+        Request one batch of titles or pageids, following continuations and merging the partial pages.
+        """
+
+        params = {
+            kind: "|".join(str(item) for item in chunk),
+            'redirects': '',
+            **PAGE_PARAMS
+        }
+
+        if not extracts:
+            params['prop'] = 'images|info'
+            del params['explaintext'], params['exlimit']
+
+        merged, renamed = await self._query_all(params)
+        by_title = {}
+        by_pageid = {}
+
+        for page in merged.values():
+            try:
+                parsed = self.parse_page(page)
+            except KeyError:
+                # Missing pages only have a title
+                if "title" in page:
+                    by_title[page["title"]] = None
+                continue
+
+            by_title[parsed["title"]] = by_pageid[parsed["pageid"]] = parsed
+
+        if extracts:
+            # The API only hands out so many extracts per response - ask again for the pages that didn't get one
+            unfetched = [pageid for pageid, parsed in by_pageid.items() if parsed["extract"] is None]
+
+            if unfetched and len(unfetched) < len(by_pageid):
+                log.debug("%d of %d pages came back without an extract, asking again", len(unfetched), len(by_pageid))
+
+                for pageid, parsed in (await self._fetch_batch('pageids', unfetched, extracts)).items():
+                    if parsed is not None:
+                        by_title[parsed["title"]] = by_pageid[pageid] = parsed
+
+            for parsed in by_pageid.values():
+                if parsed["extract"] is None:
+                    # Not one page in the request got an extract, so these really don't have any text
+                    parsed["extract"] = ""
+
+                self.page_cache.set(parsed["pageid"], parsed)
+
+        result = {}
+
+        for item in chunk:
+            if kind == 'pageids':
+                result[item] = by_pageid.get(item)
+                continue
+
+            page = by_title.get(self._follow(renamed, item))
+            result[item] = page
+            self.title_cache.set(normalize_query(item), page["pageid"] if page else None)
+
+        return result
+
+    async def image_info(self, titles: Iterable[str], *,
+                         width: int = WIKI_THUMBNAIL_WIDTH) -> Dict[str, Optional[Dict[str, Any]]]:
+        """
+        Resolve image titles to their direct URLs, MIME types and dimensions, many at a time.
+
+        Images are requested up to `WIKI_BATCH_LIMIT` at a time and cached individually,
+        so images shared between pages are only ever resolved once.
+
+        :param titles: Image titles, in the format of `File:filename.extension`
+        :param width: The width to get a thumbnail URL for
+        :return: A dict mapping each title to its url, thumburl, mime, width and height, or None if it doesn't exist
+        """
+
+        result = {}
+        missing = []
+
+        for title in dict.fromkeys(titles):
+            info = self.image_cache.get((title, width))
+
+            if info is MISSING:
+                missing.append(title)
+            else:
+                result[title] = info
+
+        for start in range(0, len(missing), WIKI_BATCH_LIMIT):
+            chunk = missing[start:start + WIKI_BATCH_LIMIT]
+            params = {
+                'prop': 'imageinfo',
+                'iiprop': 'url|mime|size',
+                'iiurlwidth': width,
+                'titles': "|".join(chunk),
+            }
+
+            pages, renamed = await self._query_all(params)
+            found = {}
+
+            for page in pages.values():
+                if page.get("imageinfo"):
+                    found[page["title"]] = self.parse_image_info(page["imageinfo"][0])
+
+            for title in chunk:
+                info = found.get(self._follow(renamed, title))
+                self.image_cache.set((title, width), info)
+                result[title] = info
+
+        return result
+
+    async def _query_all(self, params: Dict[str, Any], *,
+                         follow_generator: bool = True) -> Tuple[Dict[str, Dict[str, Any]], Dict[str, str]]:
+        """
+        Make a query, following its continuations and merging the partial pages they return.
+
+        :param params: The query parameters
+        :param follow_generator: Whether to continue the generator too - if not, only the pages from
+            the first set of generator results are completed
+        :return: The pages, keyed by pageid, and a dict of titles that were normalised or redirected to another
+        """
+
+        params = dict(params)
+        merged = {}
+        renamed = {}
+
+        while True:
+            json = await self.fetch(params)
+            query = json.get("query", {})
+
+            for change in query.get("normalized", []) + query.get("redirects", []):
+                renamed[change["from"]] = change["to"]
+
+            for key, page in query.get("pages", {}).items():
+                target = merged.setdefault(key, {})
+
+                for name, value in page.items():
+                    if isinstance(value, list):
+                        target.setdefault(name, []).extend(value)
+                    else:
+                        target[name] = value
+
+            continuation = json.get("continue")
+
+            if not continuation:
+                break
+            if not follow_generator and not any(key in continuation for key in PROP_CONTINUATIONS):
+                break
+
+            log.trace("Continuing query with %s", continuation)
+            params.update(continuation)
+
+        return merged, renamed
+
+    @staticmethod
+    def _follow(renamed: Dict[str, str], title: str) -> str:
+        """
+        Follow a title through normalisation and then redirects.
+        """
+
+        title = renamed.get(title, title)
+        return renamed.get(title, title)
+
+    async def revisions(self, pageids: Iterable[int]) -> Dict[int, int]:
+        """
+        Get the current revision of many pages, without any of their content.
+
+        :param pageids: The pages to check
+        :return: A dict mapping each pageid that still exists to its latest revision id
+        """
+
+        pageids = list(pageids)
+        result = {}
+
+        for start in range(0, len(pageids), WIKI_BATCH_LIMIT):
+            chunk = pageids[start:start + WIKI_BATCH_LIMIT]
+            json = await self.fetch({'prop': 'info', 'pageids': "|".join(str(pageid) for pageid in chunk)})
+
+            for page in json.get("query", {}).get("pages", {}).values():
+                if "pageid" in page and "lastrevid" in page:
+                    result[page["pageid"]] = page["lastrevid"]
+
+        return result
+
+    @staticmethod
+    def parse_page(page: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Pick the parts of an API page we use, and drop the rest before it goes into the cache.
+
+        The extract is None if the response didn't include one - the API only returns so many per response,
+        so that doesn't mean the page has no text.
+
+        :raises KeyError: The page is missing one of the parts we use
+        """
+
+        return {
+            "title": page["title"],
+            "extract": page.get("extract"),
+            "images": [image["title"] for image in page.get("images", ())],
+            "fullurl": page["fullurl"],
+            "pageid": page["pageid"],
+            "revision": page.get("lastrevid"),
+        }
+
+    @staticmethod
+    def parse_image_info(info: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Pick the parts of an image's info we use.
+        """
+
+        return {
+            "url": info["url"],
+            "thumburl": info.get("thumburl", info["url"]),
+            "mime": info.get("mime"),
+            "width": info.get("width", 0),
+            "height": info.get("height", 0),
+        }
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return {
+            "Wikipedia": {
+                "requests": self.requests,
+                "retries": self.retries,
+                "stale_served": self.stale_served,
+                **self.inflight.stats()
+            },
+            "Rate limiter": self.limiter.stats(),
+            "Circuit breaker": self.breaker.stats(),
+            "Search cache": self.search_cache.stats(),
+            "Page cache": self.page_cache.stats(),
+            "Title cache": self.title_cache.stats(),
+            "Image cache": self.image_cache.stats(),
+        }
@@ -1,20 +1,21 @@
 # coding=utf-8
 import os
 
-from aiohttp import AsyncResolver, ClientSession, TCPConnector
 from discord import Game
-from discord.ext.commands import AutoShardedBot, when_mentioned_or
+from discord.ext.commands import AutoShardedBot
 
 from bot.formatter import Formatter
+from bot.http import create_session
+from bot.prefixes import PrefixMatcher
 from bot.utils import CaseInsensitiveDict
 
 bot = AutoShardedBot(
-    command_prefix=when_mentioned_or(
+    command_prefix=PrefixMatcher(
         ">>> self.", ">> self.", "> self.", "self.",
         ">>> bot.", ">> bot.", "> bot.", "bot.",
         ">>> ", ">> ", "> ",
         ">>>", ">>", ">"
-    ),  # Order matters (and so do commas)
+    ),  # The longest match wins, so order doesn't matter (commas still do)
     activity=Game(name="Help: bot.help()"),
     help_attrs={"aliases": ["help()"]},
     formatter=Formatter()
@@ -23,8 +24,9 @@ bot = AutoShardedBot(
 # Make cog names case-insensitive
 bot.cogs = CaseInsensitiveDict()
 
-# Global aiohttp session for all cogs - uses asyncio for DNS resolution instead of threads, so we don't *spam threads*
-bot.http_session = ClientSession(connector=TCPConnector(resolver=AsyncResolver()))
+# Global aiohttp session for all cogs - uses asyncio for DNS resolution instead of threads, so we don't *spam threads*,
+# and keeps connections alive in a pool so cogs don't pay for a new handshake on every request
+bot.http_session = create_session()
 
 # Internal/debug
 bot.load_extension("bot.cogs.logging")